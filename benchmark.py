@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Gemini 텔레그램 봇 오프라인 벤치마크
+- 로컬 가짜 Gemini 채팅 페이지(응답 지연, 스트리밍 속도, 응답 길이 설정 가능)와
+  가짜 Gemini API(SSE) 서버, 가짜 Telegram Bot API 서버를 띄움
+- TelegramNewsBot 핸들러를 N명의 동시 사용자로 실행하여
+  p50/p95/p99 지연 시간, 처리량, 요청당 CPU/메모리 사용량을 JSON으로 출력
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import gemini_telegrambot as bot_module
+
+FAKE_GEMINI_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Gemini</title></head>
+<body>
+<div id="chat"></div>
+<div class="input-area"><textarea id="prompt-textarea" rows="2"></textarea></div>
+<script>
+const config = {delay_ms: %(delay_ms)d, chars_per_sec: %(chars_per_sec)d, length: %(length)d};
+const words = ['오늘의', '주요', '뉴스', '정치:', '경제:', '사회:', 'Gemini', '응답', '테스트', '문장입니다.'];
+function answerText() {
+    let text = '';
+    let i = 0;
+    while (text.length < config.length) {
+        text += words[i %% words.length] + ((i %% 12 === 11) ? '\\n' : ' ');
+        i++;
+    }
+    return text.slice(0, config.length);
+}
+function respond(prompt) {
+    const chat = document.getElementById('chat');
+    const userTurn = document.createElement('div');
+    userTurn.className = 'user-query';
+    userTurn.innerText = prompt;
+    chat.appendChild(userTurn);
+    const stop = document.createElement('button');
+    stop.setAttribute('aria-label', 'Stop response');
+    stop.innerText = 'Stop';
+    document.body.appendChild(stop);
+    setTimeout(() => {
+        const response = document.createElement('model-response');
+        const content = document.createElement('p');
+        response.appendChild(content);
+        chat.appendChild(response);
+        const full = answerText();
+        const step = Math.max(1, Math.round(config.chars_per_sec / 20));
+        let shown = 0;
+        const timer = setInterval(() => {
+            shown = Math.min(full.length, shown + step);
+            content.innerText = full.slice(0, shown);
+            if (shown >= full.length) {
+                clearInterval(timer);
+                stop.remove();
+            }
+        }, 50);
+    }, config.delay_ms);
+}
+document.getElementById('prompt-textarea').addEventListener('keydown', event => {
+    if (event.key === 'Enter') {
+        event.preventDefault();
+        const prompt = event.target.value;
+        event.target.value = '';
+        respond(prompt);
+    }
+});
+</script>
+</body>
+</html>
+"""
+
+
+class FakeServer:
+    """백그라운드 스레드에서 실행되는 로컬 HTTP 서버"""
+    def __init__(self, handler_class):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+
+def make_gemini_page_handler(delay_ms, chars_per_sec, length):
+    page = (FAKE_GEMINI_PAGE % {"delay_ms": delay_ms, "chars_per_sec": chars_per_sec, "length": length}).encode("utf-8")
+
+    class GeminiPageHandler(QuietHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+    return GeminiPageHandler
+
+
+def make_gemini_api_handler(delay_ms, chars_per_sec, length):
+    class GeminiApiHandler(QuietHandler):
+        protocol_version = "HTTP/1.0"
+
+        def do_POST(self):
+            self.read_body()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            time.sleep(delay_ms / 1000)
+            chunk_size = max(1, chars_per_sec // 20)
+            text = ("오늘의 주요 뉴스 테스트 응답입니다. " * (length // 20 + 1))[:length]
+            for i in range(0, len(text), chunk_size):
+                chunk = {"candidates": [{"content": {"parts": [{"text": text[i:i + chunk_size]}]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(0.05)
+
+    return GeminiApiHandler
+
+
+class FakeTelegramApi:
+    """sendMessage/editMessageText 등 봇이 사용하는 Bot API 메서드만 흉내 내는 서버"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.message_id = 0
+        self.calls = {}
+        api = self
+
+        class TelegramHandler(QuietHandler):
+            def do_POST(self):
+                method = urlparse(self.path).path.rsplit("/", 1)[-1]
+                params = api.parse_params(self.headers.get("Content-Type", ""), self.read_body())
+                self.send_json({"ok": True, "result": api.handle(method, params)})
+
+        self.server = FakeServer(TelegramHandler)
+
+    @staticmethod
+    def parse_params(content_type, body):
+        if not body:
+            return {}
+        if "application/json" in content_type:
+            return json.loads(body)
+        params = {}
+        for key, values in parse_qs(body.decode("utf-8")).items():
+            try:
+                params[key] = json.loads(values[0])
+            except ValueError:
+                params[key] = values[0]
+        return params
+
+    def handle(self, method, params):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if method == "getMe":
+                return {"id": 1, "is_bot": True, "first_name": "BenchBot", "username": "bench_bot"}
+            if method in ("deleteMessage", "answerCallbackQuery", "setWebhook", "deleteWebhook"):
+                return True
+            if method.startswith("edit"):
+                message_id = params.get("message_id")
+            else:
+                self.message_id += 1
+                message_id = self.message_id
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id", 0), "type": "private"},
+                "text": params.get("text", ""),
+            }
+
+
+class NullSheetLogger:
+    """벤치마크용 로거 (Google Sheets에 기록하지 않음)"""
+    def log(self, *args):
+        pass
+
+    def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+def make_update_data(update_id, user_id, text):
+    """Bot API가 보내는 형태의 메시지 업데이트(JSON)"""
+    command_length = len(text.split()[0]) if text.startswith("/") else 0
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+        "text": text,
+    }
+    if command_length:
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": command_length}]
+    return {"update_id": update_id, "message": message}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+
+def process_tree_usage():
+    """벤치마크 프로세스와 모든 하위 프로세스(chromedriver/Chrome 포함)의 (RSS 바이트, CPU 초) 합계 (/proc 기반)
+
+    하위 프로세스가 끝나면 그 CPU 시간은 부모의 cutime/cstime으로 옮겨지므로 이를 함께 더한다.
+    """
+    root_pid = os.getpid()
+    children = {}
+    processes = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        fields = stat[stat.rfind(")") + 2:].split()
+        pid = int(entry)
+        processes[pid] = (int(fields[21]), sum(int(fields[i]) for i in (11, 12, 13, 14)))
+        children.setdefault(int(fields[1]), []).append(pid)
+
+    rss_pages = ticks = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        if pid in processes:
+            rss_pages += processes[pid][0]
+            ticks += processes[pid][1]
+    return rss_pages * os.sysconf("SC_PAGE_SIZE"), ticks / os.sysconf("SC_CLK_TCK")
+
+
+async def sample_peak_rss(peak, interval=0.5):
+    """실행 중 프로세스 트리 RSS의 최댓값 기록"""
+    while True:
+        rss, _ = await asyncio.to_thread(process_tree_usage)
+        peak["rss"] = max(peak["rss"], rss)
+        await asyncio.sleep(interval)
+
+
+def phase_summary():
+    """봇 지표에 기록된 단계별 평균 소요 시간"""
+    summary = {}
+    for key, state in bot_module.metrics.phase_seconds.values.items():
+        if state['count']:
+            summary[dict(key)['phase']] = {
+                "count": state['count'],
+                "avg_s": round(state['sum'] / state['count'], 4),
+            }
+    return summary
+
+
+def build_bot(args, api_url, workdir):
+    executor = bot_module.ScrapeExecutor(args.workers, args.users * args.rounds, args.timeout)
+    driver_pool = None
+    profile_manager = bot_module.ChromeProfileManager(os.path.join(workdir, "profiles"), args.profile_template)
+    if args.backend == "browser" and args.pool_size > 0:
+        driver_pool = bot_module.DriverPool(profile_manager, args.pool_size)
+    store = bot_module.SqliteResponseStore(os.path.join(workdir, "bench.db"))
+    unlimited = args.users * args.rounds
+    return bot_module.TelegramNewsBot(
+        "123456:BENCH", NullSheetLogger(),
+        executor=executor,
+        driver_pool=driver_pool,
+        warmup=False,
+        profile_manager=profile_manager,
+        streaming=args.streaming,
+        news_cache=bot_module.ResponseCache(store=None),
+        store=store,
+        api_backend=bot_module.GeminiApiBackend("bench", base_url=api_url, use_search=False, store=store),
+        backend_policy=args.backend,
+        admission=bot_module.AdmissionController(args.workers, unlimited, burst=unlimited, max_per_user=unlimited),
+    )
+
+
+async def run_benchmark(args):
+    gemini_page = FakeServer(make_gemini_page_handler(args.delay_ms, args.chars_per_sec, args.length)).start()
+    gemini_api = FakeServer(make_gemini_api_handler(args.delay_ms, args.chars_per_sec, args.length)).start()
+    telegram_api = FakeTelegramApi()
+    telegram_api.server.start()
+    bot_module.GEMINI_WEB_URL = f"{gemini_page.url}/"
+
+    workdir = tempfile.mkdtemp(prefix="gemtelebot_bench_")
+    bot = build_bot(args, gemini_api.url, workdir)
+    application = bot.build_application(base_url=f"{telegram_api.server.url}/bot")
+
+    # 모든 핸들러 그룹이 끝난 뒤 실행되는 핸들러로 업데이트 처리 완료 시점을 기록한다
+    finished = {}
+
+    async def mark_finished(update, context):
+        event = finished.get(update.update_id)
+        if event:
+            event.set()
+
+    application.add_handler(TypeHandler(Update, mark_finished), group=99)
+    await application.initialize()
+    await application.start()
+    webhook_client = None
+    if args.transport == "webhook":
+        port = free_port()
+        await application.updater.start_webhook(
+            listen="127.0.0.1", port=port, url_path="telegram", secret_token="bench-secret",
+            webhook_url=f"http://127.0.0.1:{port}/telegram",
+        )
+        webhook_client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=10)
+    if bot.driver_pool and args.warmup:
+        await asyncio.to_thread(bot.driver_pool.warmup)
+
+    latencies = []
+    failures = 0
+
+    async def one_request(user_id, round_no):
+        nonlocal failures
+        text = args.text if args.command == "news" else f"/msg 벤치마크 질문 {user_id}-{round_no}"
+        data = make_update_data(user_id * 1000 + round_no, user_id, text)
+        finished[data["update_id"]] = asyncio.Event()
+        started = time.perf_counter()
+        try:
+            if webhook_client:
+                # 실제 Bot API처럼 웹훅 주소로 업데이트를 POST하고 처리 완료를 기다린다
+                response = await webhook_client.post(
+                    "/telegram", json=data, headers={"X-Telegram-Bot-Api-Secret-Token": "bench-secret"},
+                )
+                response.raise_for_status()
+            else:
+                await application.process_update(Update.de_json(data, application.bot))
+            await asyncio.wait_for(finished[data["update_id"]].wait(), args.timeout)
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            failures += 1
+            bot_module.logger.error(f"벤치마크 요청 실패: {e!r}")
+
+    # 메모리/CPU는 실행 중인 Chrome 세션까지 포함한 프로세스 트리 전체로 측정한다
+    _, cpu_before = process_tree_usage()
+    peak = {"rss": 0}
+    sampler = asyncio.ensure_future(sample_peak_rss(peak))
+    wall_started = time.perf_counter()
+    for round_no in range(args.rounds):
+        await asyncio.gather(*(one_request(user_id, round_no) for user_id in range(1, args.users + 1)))
+    wall_time = time.perf_counter() - wall_started
+    rss_after, cpu_after = process_tree_usage()
+    cpu_used = cpu_after - cpu_before
+    sampler.cancel()
+
+    requests_total = args.users * args.rounds
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "requests": requests_total,
+        "failures": failures,
+        "latency_s": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(max(latencies), 3) if latencies else None,
+        },
+        "throughput_rps": round(len(latencies) / wall_time, 3) if wall_time else None,
+        "cpu_s_per_request": round(cpu_used / requests_total, 4),
+        "rss_mb": round(rss_after / 1024 / 1024, 1),
+        "peak_rss_mb": round(max(peak["rss"], rss_after) / 1024 / 1024, 1),
+        "telegram_calls": telegram_api.calls,
+        "backends": bot.router.summary(),
+        "completion": bot.detector.summary(),
+        "phases": phase_summary(),
+    }
+
+    if webhook_client:
+        await webhook_client.aclose()
+        await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await bot.router.close()
+    bot.executor.shutdown()
+    if bot.driver_pool:
+        bot.driver_pool.close()
+    bot.store.close()
+    for server in (gemini_page, gemini_api, telegram_api.server):
+        server.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="로컬 가짜 서버로 봇의 지연 시간과 처리량을 측정합니다.")
+    parser.add_argument("--backend", choices=["browser", "api"], default="browser",
+                        help="browser: 가짜 Gemini 페이지를 Chrome으로 스크래핑, api: 가짜 Gemini API 사용")
+    parser.add_argument("--transport", choices=["direct", "webhook"], default="direct",
+                        help="direct: 핸들러를 직접 호출, webhook: 봇의 웹훅 서버로 업데이트를 POST")
+    parser.add_argument("--command", choices=["msg", "news"], default="msg")
+    parser.add_argument("--text", default="/news", help="--command news일 때 보낼 메시지")
+    parser.add_argument("--users", type=int, default=4, help="동시 사용자 수")
+    parser.add_argument("--rounds", type=int, default=3, help="사용자당 요청 횟수")
+    parser.add_argument("--workers", type=int, default=2, help="스크래퍼 워커 수")
+    parser.add_argument("--pool-size", type=int, default=2, help="Chrome 세션 풀 크기 (0이면 요청마다 실행)")
+    parser.add_argument("--warmup", action="store_true", help="측정 전에 Chrome 세션 예열")
+    parser.add_argument("--profile-template", default=None, help="복제할 Chrome 프로필 템플릿")
+    parser.add_argument("--streaming", action="store_true", help="스트리밍 편집 모드 사용")
+    parser.add_argument("--delay-ms", type=int, default=500, help="가짜 응답이 시작되기까지의 지연(ms)")
+    parser.add_argument("--chars-per-sec", type=int, default=400, help="가짜 응답 스트리밍 속도(문자/초)")
+    parser.add_argument("--length", type=int, default=1500, help="가짜 응답 길이(문자)")
+    parser.add_argument("--timeout", type=float, default=120, help="요청당 최대 대기 시간(초)")
+    parser.add_argument("--output", help="결과 JSON을 저장할 파일 (기본값: 표준 출력)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = asyncio.run(run_benchmark(args))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+    sys.exit(1 if result["failures"] else 0)
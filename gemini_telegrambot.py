@@ -9,17 +9,37 @@ Gemini 뉴스 스크래퍼 - Telegram Bot 연동 버전
 import json
 import time
 import asyncio
+import threading
 import gspread
+import httpx
 import os
+import random
+import re
+import glob
+import functools
+import difflib
+import hashlib
+import shutil
+import sqlite3
+import subprocess
+import unicodedata
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from google.oauth2.service_account import Credentials
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.chrome.options import Options
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from selenium.common.exceptions import WebDriverException
+from urllib3.exceptions import HTTPError as DriverConnectionError
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
 import logging
 
 # 로깅 설정
@@ -28,236 +48,2949 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 사용자별 언어/지역 설정을 저장할 딕셔너리
-user_settings = {}
+# Gemini 웹 주소 (벤치마크에서는 로컬 가짜 페이지로 바꿔서 사용)
+GEMINI_WEB_URL = os.getenv('GEMINI_WEB_URL', 'https://gemini.google.com/')
+
+class Counter:
+    """단조 증가 카운터 (레이블 조합별로 값 유지)"""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, dict(key), value) for key, value in self.values.items()]
+
+class Gauge:
+    """현재 값을 나타내는 게이지 (fn을 주면 수집할 때마다 값을 계산)"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        if self.fn:
+            try:
+                return [(self.name, {}, self.fn())]
+            except Exception as e:
+                logger.debug(f"게이지 {self.name} 계산 실패: {e}")
+                return []
+        with self.lock:
+            return [(self.name, dict(key), value) for key, value in self.values.items()]
+
+class Histogram:
+    """누적 버킷 히스토그램 (Prometheus 형식, 레이블 조합별 합계/개수 유지)"""
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            state = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, state in self.values.items():
+                labels = dict(key)
+                for bound, count in zip(self.buckets, state['buckets']):
+                    samples.append((f"{self.name}_bucket", {**labels, 'le': str(bound)}, count))
+                samples.append((f"{self.name}_bucket", {**labels, 'le': '+Inf'}, state['count']))
+                samples.append((f"{self.name}_sum", labels, round(state['sum'], 6)))
+                samples.append((f"{self.name}_count", labels, state['count']))
+        return samples
+
+class MetricsRegistry:
+    """지표 모음 (/metrics 응답 생성, 요청 처리 단계별 시간 측정)"""
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+        self.phase_seconds = self.histogram("gemtelebot_phase_seconds", "요청 처리 단계별 소요 시간(초)")
+
+    def register(self, metric):
+        """지표 등록 (같은 이름이 있으면 기존 지표 반환, 게이지는 계산 함수만 교체)"""
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is None:
+                self.metrics[metric.name] = metric
+                return metric
+        if isinstance(existing, Gauge) and isinstance(metric, Gauge) and metric.fn:
+            existing.fn = metric.fn
+        return existing
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, fn=None):
+        return self.register(Gauge(name, help_text, fn))
+
+    def histogram(self, name, help_text, buckets=Histogram.DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def observe_phase(self, phase, seconds, record=None):
+        """단계 소요 시간을 히스토그램에 기록 (record가 있으면 요청별 추적 정보에도 저장)"""
+        if seconds is None:
+            return
+        self.phase_seconds.observe(seconds, phase=phase)
+        if record is not None:
+            record[phase] = round(seconds, 3)
+
+    @contextmanager
+    def timer(self, phase, record=None):
+        """with 블록의 실행 시간을 단계 시간으로 기록 (예외가 나도 기록)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(phase, time.perf_counter() - started, record)
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ""
+        escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                   for k, v in labels.items())
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self):
+        """Prometheus 텍스트 형식으로 모든 지표 출력"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{self.format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+# 프로세스 전역 지표 (logger와 같이 모듈 어디서나 사용)
+metrics = MetricsRegistry()
+request_count = metrics.counter("gemtelebot_requests_total", "명령어/결과별 요청 수")
+request_seconds = metrics.histogram("gemtelebot_request_seconds", "명령어별 전체 요청 처리 시간(초)")
+scrape_failures = metrics.counter("gemtelebot_scrape_failures_total", "유형별 스크래핑 실패 수")
+backend_request_count = metrics.counter("gemtelebot_backend_requests_total", "백엔드/결과별 응답 생성 시도 수")
+news_cache_lookups = metrics.counter("gemtelebot_news_cache_lookups_total", "뉴스 캐시 조회 결과(hit/miss)")
+selector_lookups = metrics.counter("gemtelebot_selector_lookups_total", "요소별 선택자 캐시 조회 결과(hit/miss)")
+msg_cache_lookups = metrics.counter("gemtelebot_msg_cache_lookups_total", "/msg 유사 질문 색인 조회 결과(hit/miss/skip)")
+sheet_log_rows = metrics.counter("gemtelebot_sheet_log_rows_total", "기록한 로그 행 수 (sheet: 시트, journal: 저널 파일)")
+
+class MetricsServer:
+    """/metrics 경로로 지표를 제공하는 HTTP 서버 (데몬 스레드에서 실행)"""
+    def __init__(self, registry, port, host="0.0.0.0"):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self.server = None
+
+    def start(self):
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"지표 서버가 시작되었습니다: http://{self.host}:{self.server.server_port}/metrics")
+        return self
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+class TraceLog:
+    """요청마다 단계별 소요 시간을 한 줄씩 기록하는 JSONL 추적 로그"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def write(self, trace):
+        try:
+            with self.lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logger.warning(f"추적 로그 기록 실패: {e}")
+
+def chrome_rss_bytes(root_pid=None):
+    """봇이 실행한 chromedriver/Chrome 하위 프로세스의 RSS 합계 (/proc 기반, 리눅스 외에는 0)"""
+    root_pid = root_pid or os.getpid()
+    children = {}
+    processes = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 프로세스 이름에 공백이나 괄호가 있을 수 있어 마지막 ')' 이후를 필드로 사용한다
+        name = stat[stat.find('(') + 1:stat.rfind(')')]
+        fields = stat[stat.rfind(')') + 2:].split()
+        pid = int(entry)
+        processes[pid] = (name, int(fields[21]))
+        children.setdefault(int(fields[1]), []).append(pid)
+
+    total_pages = 0
+    pending = list(children.get(root_pid, []))
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        name, rss_pages = processes[pid]
+        if 'chrom' in name.lower():
+            total_pages += rss_pages
+    return total_pages * os.sysconf('SC_PAGE_SIZE')
 
 class GoogleSheetLogger:
-    def __init__(self, credentials_file, sheet_name):
+    """요청 로그를 모아서 Google Sheets에 일괄 기록하는 로거 (실패한 로그는 파일에 보관 후 재전송)"""
+    JOURNAL_PATH = os.path.join("logs", "failed_sheet_logs.txt")
+
+    def __init__(self, credentials_file, sheet_name, batch_size=20, flush_interval=5.0, max_retries=5,
+                 reconnect_interval=60.0):
+        self.credentials_file = credentials_file
+        self.sheet_name = sheet_name
         self.client = None
         self.sheet = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.reconnect_interval = reconnect_interval
+        self.last_connect = 0
+        self.buffer = deque()
+        self.flush_event = None
+        self.task = None
+        self.journal_lock = threading.Lock()
+        self.connect()
+
+    def connect(self):
+        """Google Sheets 연결 (실패하면 로그는 파일로 기록하고 백그라운드 작업에서 다시 연결)"""
+        self.last_connect = time.time()
         try:
             scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-            creds = Credentials.from_service_account_file(credentials_file, scopes=scopes)
-            self.client = gspread.authorize(creds)
-            self.sheet = self.client.open(sheet_name).sheet1
+            creds = Credentials.from_service_account_file(self.credentials_file, scopes=scopes)
+            client = gspread.authorize(creds)
+            self.sheet = client.open(self.sheet_name).sheet1
+            self.client = client
             self.ensure_header()
-            logger.info(f"Google Sheets '{sheet_name}'에 성공적으로 연결되었습니다.")
+            logger.info(f"Google Sheets '{self.sheet_name}'에 성공적으로 연결되었습니다.")
+            return True
         except Exception as e:
             logger.error(f"Google Sheets 연결 실패: {e}. 로그는 파일로 기록됩니다.")
             self.client = None
+            return False
+
+    def reconnect(self):
+        """연결이 없으면 reconnect_interval마다 다시 연결하고, 성공하면 보관된 로그를 재전송"""
+        if self.client or time.time() - self.last_connect < self.reconnect_interval:
+            return
+        if self.connect():
+            self.replay_journal()
+
+    def ensure_header(self):
+        if self.client and self.sheet.cell(1, 1).value != "Timestamp":
+            header = ["Timestamp", "User ID", "Username", "Request", "Response", "Elapsed Time (s)"]
+            self.sheet.insert_row(header, 1)
+
+    def log_to_file(self, rows):
+        """시트에 기록하지 못한 로그를 저널 파일에 보관"""
+        try:
+            with self.journal_lock:
+                os.makedirs(os.path.dirname(self.JOURNAL_PATH), exist_ok=True)
+                with open(self.JOURNAL_PATH, "a", encoding="utf-8") as f:
+                    for row in rows:
+                        f.write(json.dumps(row) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+        except Exception as file_e:
+            logger.error(f"파일 로그 기록 실패: {file_e}")
+
+    def log(self, user_id, username, request, response, elapsed_time):
+        """로그를 버퍼에 추가 (시트 기록은 백그라운드에서 일괄 처리)"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        row_data = [timestamp, str(user_id), username, request, response, f"{elapsed_time:.2f}"]
+        self.buffer.append(row_data)
+        if self.task is None:
+            # 백그라운드 작업이 없으면 (시작 전 또는 종료 후) 바로 기록한다
+            self.flush()
+        elif len(self.buffer) >= self.batch_size:
+            self.flush_event.set()
+
+    def is_retryable(self, error):
+        """429(할당량 초과)와 5xx 오류, 네트워크 오류는 재시도"""
+        if isinstance(error, gspread.exceptions.APIError):
+            status = getattr(error.response, 'status_code', 0)
+            return status == 429 or status >= 500
+        return isinstance(error, (ConnectionError, TimeoutError, OSError))
+
+    def append_rows(self, rows):
+        """재시도(지수 백오프)를 포함한 일괄 기록, 성공 여부 반환"""
+        for attempt in range(self.max_retries):
+            try:
+                self.sheet.append_rows(rows, value_input_option='RAW')
+                return True
+            except Exception as e:
+                if not self.is_retryable(e) or attempt == self.max_retries - 1:
+                    logger.error(f"Google Sheets 로깅 실패: {e}. 파일에 기록합니다.")
+                    return False
+                delay = min(60, 2 ** attempt)
+                logger.warning(f"Google Sheets 일시적 오류, {delay}초 후 재시도: {e}")
+                time.sleep(delay)
+        return False
+
+    def replay_journal(self):
+        """연결이 복구되면 저널에 보관된 로그를 시트로 재전송"""
+        replay_path = f"{self.JOURNAL_PATH}.replay"
+        with self.journal_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.JOURNAL_PATH) or os.path.getsize(self.JOURNAL_PATH) == 0:
+                    return
+                os.replace(self.JOURNAL_PATH, replay_path)
+        try:
+            with open(replay_path, "r", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        except Exception as e:
+            logger.error(f"로그 저널 읽기 실패: {e}")
+            return
+        for i in range(0, len(rows), self.batch_size * 10):
+            if not self.append_rows(rows[i:i + self.batch_size * 10]):
+                # 재전송하지 못한 나머지는 다음 기회에 다시 시도한다
+                self.log_to_file(rows[i:])
+                break
+        os.remove(replay_path)
+        logger.info(f"보관된 로그 {len(rows)}건을 재전송했습니다.")
+
+    def flush(self):
+        """버퍼에 쌓인 로그를 한 번에 기록 (블로킹, 워커 스레드에서 호출)"""
+        rows = []
+        while self.buffer:
+            rows.append(self.buffer.popleft())
+        if not rows:
+            return
+        with metrics.timer('log_flush'):
+            if self.client and self.append_rows(rows):
+                self.replay_journal()
+                sheet_log_rows.inc(len(rows), result='sheet')
+            else:
+                self.log_to_file(rows)
+                sheet_log_rows.inc(len(rows), result='journal')
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_event.clear()
+            await asyncio.to_thread(self.reconnect)
+            await asyncio.to_thread(self.flush)
+
+    def start(self):
+        """백그라운드 기록 작업 시작 (이벤트 루프 안에서 호출)"""
+        self.flush_event = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self):
+        """백그라운드 작업을 멈추고 남은 로그를 모두 기록"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await asyncio.to_thread(self.flush)
+
+class JsonFileResponseStore:
+    """응답마다 JSON 파일을 하나씩 만드는 기존 방식의 저장소"""
+    def save(self, data, user_id=None):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        prefix = "gemini_news" if "뉴스" in data["prompt"] else "gemini_response"
+        filename = f"{prefix}_{timestamp}.json"
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            logger.info(f"결과가 {filename}에 저장되었습니다.")
+            return filename
+        except Exception as e:
+            logger.error(f"JSON 파일 저장 중 오류: {e}")
+            raise
+
+class SqliteResponseStore:
+    """요청/응답 기록을 SQLite(WAL 모드) 하나에 저장하는 저장소 (응답 캐시 백엔드로도 사용)"""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            user_id TEXT,
+            lang TEXT,
+            region TEXT,
+            prompt TEXT NOT NULL,
+            prompt_hash TEXT NOT NULL,
+            response TEXT,
+            source TEXT,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_timestamp ON responses(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_responses_user ON responses(user_id);
+        CREATE INDEX IF NOT EXISTS idx_responses_region ON responses(region);
+        CREATE INDEX IF NOT EXISTS idx_responses_prompt_hash ON responses(prompt_hash);
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL,
+            value TEXT NOT NULL
+        );
+    """
+    CORE_FIELDS = ("timestamp", "prompt", "response", "source", "lang", "region")
+
+    def __init__(self, path="data/gemtelebot.db"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def prompt_hash(prompt):
+        """공백/대소문자를 정규화한 프롬프트 해시"""
+        normalized = ' '.join(prompt.split()).lower()
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def save(self, data, user_id=None):
+        """응답 기록 저장 후 참조 문자열 반환"""
+        extra = {k: v for k, v in data.items() if k not in self.CORE_FIELDS}
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO responses (timestamp, user_id, lang, region, prompt, prompt_hash, response, source, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (data["timestamp"], str(user_id) if user_id is not None else None, data.get("lang"),
+                 data.get("region"), data["prompt"], self.prompt_hash(data["prompt"]), data.get("response"),
+                 data.get("source"), json.dumps(extra, ensure_ascii=False) if extra else None),
+            )
+        logger.info(f"결과가 {self.path}에 저장되었습니다. (id: {cursor.lastrowid})")
+        return f"sqlite:{cursor.lastrowid}"
+
+    def query(self, user_id=None, region=None, prompt=None, since=None, limit=100):
+        """조건에 맞는 최근 기록 조회 (인덱스 사용)"""
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(str(user_id))
+        if region is not None:
+            clauses.append("region = ?")
+            params.append(region)
+        if prompt is not None:
+            clauses.append("prompt_hash = ?")
+            params.append(self.prompt_hash(prompt))
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM responses {where} ORDER BY timestamp DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def compact(self, retention_days):
+        """보관 기간이 지난 기록을 삭제하고 WAL 파일과 빈 공간 정리"""
+        cutoff = datetime.fromtimestamp(time.time() - retention_days * 86400).isoformat()
+        with self.lock:
+            with self.conn:
+                deleted = self.conn.execute("DELETE FROM responses WHERE timestamp < ?", (cutoff,)).rowcount
+                self.conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if deleted:
+                self.conn.execute("VACUUM")
+        logger.info(f"보관 기간이 지난 응답 기록 {deleted}건을 정리했습니다.")
+        return deleted
+
+    def import_json_files(self, directory=".", delete=False):
+        """기존 gemini_news_*.json / gemini_response_*.json 파일을 가져오기"""
+        paths = sorted(glob.glob(os.path.join(directory, "gemini_news_*.json")) +
+                       glob.glob(os.path.join(directory, "gemini_response_*.json")))
+        imported = 0
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.save(data)
+                imported += 1
+                if delete:
+                    os.remove(path)
+            except Exception as e:
+                logger.warning(f"{path} 가져오기 실패: {e}")
+        logger.info(f"JSON 파일 {imported}/{len(paths)}건을 가져왔습니다.")
+        return imported
+
+    def cache_load(self):
+        """만료되지 않은 캐시 항목 (key, expires_at, value) 목록"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, expires_at, value FROM response_cache WHERE expires_at > ? ORDER BY expires_at",
+                (time.time(),),
+            ).fetchall()
+        return [(row["key"], row["expires_at"], json.loads(row["value"])) for row in rows]
+
+    def cache_set(self, key, expires_at, value):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, expires_at, json.dumps(value, ensure_ascii=False)),
+            )
+
+    def cache_delete(self, keys):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM response_cache WHERE key = ?", [(key,) for key in keys])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class UserSettingsStore:
+    """사용자별 언어/지역 설정 저장소 (메모리 캐시 + SQLite, 변경 사항은 모아서 기록)"""
+    DEFAULTS = {'lang': 'ko', 'region': 'KR'}
+
+    def __init__(self, path=None, flush_interval=5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.cache = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.task = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            # 캐시 잠금과 별개로 DB 연결 사용만 직렬화한다 (디스크 기록 중에도 get()이 막히지 않도록)
+            self.db_lock = threading.Lock()
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_settings ("
+                "user_id INTEGER PRIMARY KEY, lang TEXT NOT NULL, region TEXT NOT NULL, updated_at REAL)"
+            )
+
+    def read(self, user_id):
+        """캐시에 없는 사용자의 설정을 DB에서 읽기 (사용자당 최초 1회)"""
+        if not self.conn:
+            return dict(self.DEFAULTS)
+        with self.db_lock:
+            row = self.conn.execute(
+                "SELECT lang, region FROM user_settings WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return {'lang': row[0], 'region': row[1]} if row else dict(self.DEFAULTS)
+
+    def get(self, user_id):
+        """사용자 설정 조회 (캐시에 있으면 디스크 접근 없음)"""
+        with self.lock:
+            settings = self.cache.get(user_id)
+            if settings is not None:
+                return dict(settings)
+        # DB 읽기는 캐시 잠금 밖에서 하고, 그 사이 다른 곳에서 채운 값이 있으면 그 값을 쓴다
+        settings = self.read(user_id)
+        with self.lock:
+            return dict(self.cache.setdefault(user_id, settings))
+
+    def update(self, user_id, **changes):
+        """설정 변경 (DB 기록은 백그라운드에서 일괄 처리)"""
+        stored = None if user_id in self.cache else self.read(user_id)
+        with self.lock:
+            settings = self.cache.get(user_id) or stored
+            settings.update(changes)
+            self.cache[user_id] = settings
+            self.dirty.add(user_id)
+        if self.task is None:
+            self.flush()
+
+    def flush(self):
+        """변경된 설정을 DB에 한 번에 기록"""
+        if not self.conn:
+            return
+        # 변경된 행만 잠금 안에서 복사하고, 디스크 기록은 잠금을 놓은 뒤에 한다
+        with self.lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            rows = [(user_id, self.cache[user_id]['lang'], self.cache[user_id]['region'], now)
+                    for user_id in self.dirty]
+            self.dirty.clear()
+        with self.db_lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO user_settings (user_id, lang, region, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def active_pairs(self):
+        """저장된 모든 (언어, 지역) 조합"""
+        with self.lock:
+            pairs = {(s['lang'], s['region']) for s in self.cache.values()}
+        if self.conn:
+            with self.db_lock:
+                pairs.update(self.conn.execute("SELECT DISTINCT lang, region FROM user_settings").fetchall())
+        return pairs
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def start(self):
+        """주기적 기록 작업 시작 (설정은 사용자별로 처음 조회할 때 읽는다, 이벤트 루프 안에서 호출)"""
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self):
+        """남은 변경 사항을 기록하고 DB 연결 종료"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.flush()
+        if self.conn:
+            self.conn.close()
+
+def gemini_url(lang='ko', region='KR'):
+    """언어/지역 설정이 포함된 Gemini 새 대화 URL"""
+    return f"{GEMINI_WEB_URL}?lang={lang}&region={region}"
+
+def create_chrome_driver(user_data_dir="/tmp/chrome_profile", page_load_timeout=30):
+    """헤드리스 Chrome 드라이버 생성 (페이지 로딩이 멈춰도 워커 스레드가 무한정 묶이지 않도록 제한 시간 설정)"""
+    chrome_options = Options()
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--headless")  # 백그라운드 실행
+    chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
+    driver = webdriver.Chrome(options=chrome_options)
+    driver.set_page_load_timeout(page_load_timeout)
+    return driver
+
+def wait_for_page_ready(driver, timeout=15):
+    """문서 로딩과 입력창 렌더링이 끝날 때까지 대기 (고정 sleep 대신 사용)"""
+    WebDriverWait(driver, timeout).until(
+        lambda d: d.execute_script("return document.readyState") == "complete"
+    )
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: d.execute_script(
+                "return !!document.querySelector(\"textarea, [contenteditable='true']\")"
+            )
+        )
+    except Exception:
+        logger.warning("입력창 렌더링 대기 시간이 초과되었습니다.")
+
+class ChromeProfileManager:
+    """드라이버마다 독립된 Chrome 프로필 디렉토리를 발급하는 관리자"""
+    # Chrome이 실행 중인 프로필에 남기는 잠금 파일 (복제본에 남아 있으면 실행이 거부된다)
+    LOCK_FILES = ("SingletonLock", "SingletonSocket", "SingletonCookie")
+    # 복제 직후 Chrome이 잠금 파일을 만들기 전의 프로필을 지우지 않도록 두는 유예 시간(초)
+    MIN_PROFILE_AGE = 120
+
+    def __init__(self, base_dir="/tmp/gemtelebot_profiles", template_dir=None, max_disk_mb=2048):
+        self.base_dir = base_dir
+        self.template_dir = template_dir
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024
+        self.active = set()
+        self.lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def clone_template(self, path):
+        """로그인된 템플릿 프로필 복제 (가능하면 copy-on-write)"""
+        if not self.template_dir or not os.path.isdir(self.template_dir):
+            os.makedirs(path)
+            return
+        try:
+            # reflink를 지원하는 파일시스템(btrfs, xfs 등)에서는 데이터 블록을 복사하지 않는다
+            subprocess.run(["cp", "-a", "--reflink=auto", self.template_dir, path],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(path, ignore_errors=True)
+            shutil.copytree(self.template_dir, path, symlinks=True,
+                            ignore=shutil.ignore_patterns(*self.LOCK_FILES))
+        for name in self.LOCK_FILES:
+            lock_path = os.path.join(path, name)
+            if os.path.lexists(lock_path):
+                os.remove(lock_path)
+
+    def acquire(self):
+        """새 프로필 디렉토리 발급"""
+        path = os.path.join(self.base_dir, f"profile_{uuid.uuid4().hex[:12]}")
+        with self.lock:
+            self.active.add(path)
+        try:
+            self.clone_template(path)
+        except Exception:
+            self.release(path)
+            raise
+        self.enforce_disk_cap()
+        return path
+
+    def release(self, path):
+        """사용이 끝난 프로필 삭제"""
+        with self.lock:
+            self.active.discard(path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def dir_size(self, path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    continue
+        return total
+
+    def in_use_elsewhere(self, path):
+        """다른 프로세스(같은 디렉토리를 쓰는 다른 워커)의 Chrome이 사용 중인 프로필인지 확인
+
+        Chrome은 SingletonLock을 "호스트명-PID"를 가리키는 심볼릭 링크로 만든다.
+        """
+        try:
+            target = os.readlink(os.path.join(path, "SingletonLock"))
+        except OSError:
+            return time.time() - os.path.getmtime(path) < self.MIN_PROFILE_AGE
+        host, _, pid = target.rpartition('-')
+        if host != os.uname().nodename or not pid.isdigit():
+            # 다른 호스트의 프로세스는 확인할 수 없으므로 사용 중으로 본다
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def enforce_disk_cap(self):
+        """디스크 사용량이 한도를 넘으면 사용 중이 아닌 오래된 프로필부터 삭제 (다른 프로세스가 사용 중인 프로필 제외)"""
+        with self.lock:
+            active = set(self.active)
+        profiles = []
+        for name in os.listdir(self.base_dir):
+            path = os.path.join(self.base_dir, name)
+            if os.path.isdir(path):
+                profiles.append((os.path.getmtime(path), path, self.dir_size(path)))
+
+        total = sum(size for _, _, size in profiles)
+        for _, path, size in sorted(profiles):
+            if total <= self.max_disk_bytes:
+                break
+            if path in active or self.in_use_elsewhere(path):
+                continue
+            logger.info(f"디스크 한도 초과로 오래된 Chrome 프로필을 삭제합니다: {path}")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        if total > self.max_disk_bytes:
+            logger.warning(f"사용 중인 Chrome 프로필이 디스크 한도를 초과했습니다. ({total // (1024 * 1024)}MB)")
+
+class DriverSession:
+    """드라이버 풀에서 관리하는 Chrome 세션"""
+    def __init__(self, driver, profile_dir=None):
+        self.driver = driver
+        self.profile_dir = profile_dir
+        self.uses = 0
+        self.created_at = time.time()
+        self.last_used = time.time()
+        self.lang = None
+        self.region = None
+
+class DriverPool:
+    """미리 실행하고 Gemini에 접속해 둔 Chrome 세션을 재사용하는 풀"""
+    def __init__(self, profile_manager, size=2, max_uses=20, max_idle=600, max_heap_mb=512, lang='ko', region='KR'):
+        self.profile_manager = profile_manager
+        self.size = size
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self.max_heap_bytes = max_heap_mb * 1024 * 1024
+        self.lang = lang
+        self.region = region
+        self.idle = []
+        self.total = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def navigate(self, session, lang, region):
+        """세션을 새 대화 페이지로 이동 (브라우저 재시작 없이 사용자 간 상태 초기화)"""
+        with metrics.timer('access_gemini'):
+            session.driver.get(gemini_url(lang, region))
+            wait_for_page_ready(session.driver)
+        session.lang, session.region = lang, region
+
+    def launch(self, lang, region):
+        """새 Chrome 세션을 실행하고 Gemini에 미리 접속"""
+        profile_dir = self.profile_manager.acquire()
+        try:
+            session = DriverSession(create_chrome_driver(profile_dir), profile_dir)
+        except Exception:
+            self.profile_manager.release(profile_dir)
+            raise
+        try:
+            self.navigate(session, lang, region)
+        except Exception:
+            self.quit(session)
+            raise
+        logger.info(f"Chrome 세션을 새로 준비했습니다. (풀: {self.total}/{self.size})")
+        return session
+
+    def quit(self, session):
+        try:
+            session.driver.quit()
+        except Exception as e:
+            logger.warning(f"Chrome 세션 종료 중 오류: {e}")
+        finally:
+            self.profile_manager.release(session.profile_dir)
+
+    def discard(self, session):
+        """세션을 종료하고 풀 슬롯을 반환"""
+        self.quit(session)
+        with self.condition:
+            self.total -= 1
+            self.condition.notify()
+
+    def is_healthy(self, session):
+        """세션 응답 여부와 JS 힙 사용량 확인"""
+        try:
+            heap = session.driver.execute_script(
+                "return performance.memory ? performance.memory.usedJSHeapSize : 0"
+            )
+            return (heap or 0) < self.max_heap_bytes
+        except Exception:
+            return False
+
+    def evict_idle(self):
+        """오래 사용되지 않은 유휴 세션 정리"""
+        now = time.time()
+        with self.condition:
+            expired = [s for s in self.idle if now - s.last_used > self.max_idle]
+            self.idle = [s for s in self.idle if s not in expired]
+        for session in expired:
+            logger.info("유휴 시간이 초과된 Chrome 세션을 종료합니다.")
+            self.discard(session)
+
+    def checkout(self, lang='ko', region='KR', timeout=60, exclude=()):
+        """사용 가능한 세션 대여 (없으면 새로 실행, 풀이 가득 차면 반납 대기)
+
+        exclude의 세션(재시도 전에 실패한 세션)은 다른 유휴 세션이나 새 세션을 쓸 수 없을 때만 다시 사용한다.
+        """
+        self.evict_idle()
+        deadline = time.time() + timeout
+        while True:
+            session = None
+            with self.condition:
+                while not self.idle and self.total >= self.size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or self.closed:
+                        raise TimeoutError("사용 가능한 Chrome 세션이 없습니다.")
+                    self.condition.wait(remaining)
+                candidates = [s for s in self.idle if s not in exclude]
+                if candidates:
+                    session = candidates[-1]
+                    self.idle.remove(session)
+                elif self.total < self.size:
+                    self.total += 1
+                else:
+                    session = self.idle.pop()
+
+            if session is None:
+                try:
+                    session = self.launch(lang, region)
+                except Exception:
+                    with self.condition:
+                        self.total -= 1
+                        self.condition.notify()
+                    raise
+            elif not self.is_healthy(session):
+                logger.warning("비정상 Chrome 세션을 폐기합니다.")
+                self.discard(session)
+                continue
+            elif (session.lang, session.region) != (lang, region):
+                try:
+                    self.navigate(session, lang, region)
+                except Exception as e:
+                    # 이동에 실패한 세션은 폐기하고 다른 세션(또는 새 세션)으로 다시 시도
+                    logger.warning(f"Chrome 세션 언어/지역 전환 실패, 세션을 폐기합니다: {e}")
+                    self.discard(session)
+                    continue
+
+            session.last_used = time.time()
+            return session
+
+    def checkin(self, session, healthy=True):
+        """세션 반납 (사용 횟수 초과나 오류 시 폐기, 그 외에는 새 대화로 초기화 후 재사용)"""
+        session.uses += 1
+        session.last_used = time.time()
+        if self.closed or not healthy or session.uses >= self.max_uses:
+            self.discard(session)
+            return
+        threading.Thread(target=self.reset, args=(session,), daemon=True).start()
+
+    def reset(self, session):
+        """다음 사용자를 위해 새 대화 페이지로 이동한 뒤 유휴 목록에 추가"""
+        try:
+            self.navigate(session, session.lang or self.lang, session.region or self.region)
+        except Exception as e:
+            logger.warning(f"Chrome 세션 초기화 실패: {e}")
+            self.discard(session)
+            return
+        with self.condition:
+            self.idle.append(session)
+            self.condition.notify()
+
+    def register_gauges(self):
+        """풀 크기, 실행 중인 세션 수, 사용률 게이지 등록 (봇과 스크래퍼 워커에서 함께 사용)"""
+        metrics.gauge("gemtelebot_driver_pool_size", "Chrome 세션 풀 크기", lambda: self.size)
+        metrics.gauge("gemtelebot_driver_pool_sessions", "실행 중인 Chrome 세션 수", lambda: self.total)
+        metrics.gauge("gemtelebot_driver_pool_utilization", "사용 중인 세션 비율 (풀 크기 대비)",
+                      lambda: round((self.total - len(self.idle)) / self.size, 3) if self.size else 0)
+
+    def warmup(self):
+        """시작 시 풀 크기만큼 세션을 미리 실행"""
+        sessions = []
+        for _ in range(self.size):
+            try:
+                sessions.append(self.checkout(self.lang, self.region, timeout=0))
+            except Exception as e:
+                logger.warning(f"Chrome 세션 예열 실패: {e}")
+                break
+        with self.condition:
+            self.idle.extend(sessions)
+            self.condition.notify_all()
+        logger.info(f"Chrome 세션 {len(sessions)}개를 예열했습니다.")
+
+    def close(self):
+        """모든 세션 종료"""
+        with self.condition:
+            self.closed = True
+            sessions, self.idle = self.idle, []
+            self.condition.notify_all()
+        for session in sessions:
+            self.discard(session)
+
+class ScrapeCancelledError(Exception):
+    """스크래핑이 취소되었을 때 발생하는 예외"""
+
+class ScrapeError(Exception):
+    """분류된 스크래핑 실패 (retryable: 다른 세션으로 다시 시도할 가치가 있는지, session_broken: 세션을 폐기할지)"""
+    kind = "unknown"
+    retryable = True
+    session_broken = True
+
+class NavigationError(ScrapeError):
+    """Gemini 페이지 접속/로딩 실패"""
+    kind = "navigation"
+
+class InputNotFoundError(ScrapeError):
+    """입력창을 찾지 못했거나 입력할 수 없음 (DOM 변경 가능성)"""
+    kind = "input_not_found"
+
+class EmptyResponseError(ScrapeError):
+    """응답이 시작되지 않았거나 추출된 응답이 비어 있음"""
+    kind = "empty_response"
+    session_broken = False
+
+class DriverCrashError(ScrapeError):
+    """Chrome/chromedriver가 종료되었거나 응답하지 않음"""
+    kind = "driver_crash"
+
+class CircuitOpenError(Exception):
+    """차단기가 열려 있어 요청을 바로 거절할 때 발생하는 예외"""
+
+# 이 문구가 포함된 WebDriver 오류는 브라우저 세션 자체가 죽은 것으로 본다
+DRIVER_CRASH_MESSAGES = (
+    'invalid session id', 'chrome not reachable', 'disconnected', 'session deleted', 'no such window',
+    'target window already closed', 'tab crashed', 'connection refused', 'max retries exceeded',
+    'connection aborted', 'remote end closed',
+)
+
+def classify_scrape_error(error, default=ScrapeError):
+    """스크래핑 중 발생한 예외를 실패 유형으로 분류 (세션이 죽은 경우는 단계와 관계없이 DriverCrashError)"""
+    if isinstance(error, ScrapeError):
+        return error
+    # chromedriver와의 HTTP 연결 자체가 실패했다면(urllib3 MaxRetryError, ProtocolError 등) 드라이버가 죽은 것이다
+    if isinstance(error, DriverConnectionError):
+        return DriverCrashError(str(error))
+    message = str(error).lower()
+    if isinstance(error, (WebDriverException, ConnectionError)) and any(s in message for s in DRIVER_CRASH_MESSAGES):
+        return DriverCrashError(str(error))
+    return default(str(error))
+
+class ScraperBusyError(Exception):
+    """대기열이 가득 찼을 때 발생하는 예외"""
+    def __init__(self, position):
+        super().__init__(f"스크래퍼 대기열이 가득 찼습니다. (대기 순번: {position})")
+        self.position = position
+
+class ResponseCompletionDetector:
+    """DOM을 폴링하여 응답 생성 완료 시점을 감지하고 첫 토큰/완료 시간을 기록하는 감지기"""
+    RESPONSE_SELECTORS = [
+        "model-response",
+        "message-content",
+        ".model-response-text",
+        "[data-message-author-role='model']",
+        ".response-container",
+    ]
+    GENERATING_SELECTORS = [
+        "button[aria-label*='Stop']",
+        "button[aria-label*='중지']",
+        "[data-test-id='stop-button']",
+        ".stop-icon",
+        "[aria-busy='true']",
+    ]
+    # 응답 노드 수, 마지막 응답 텍스트, 생성 중 표시 여부를 한 번의 호출로 가져온다
+    POLL_SCRIPT = """
+        const [responseSelectors, generatingSelectors] = arguments;
+        let count = 0, text = '';
+        for (const selector of responseSelectors) {
+            const nodes = document.querySelectorAll(selector);
+            if (nodes.length) {
+                count = nodes.length;
+                text = nodes[nodes.length - 1].innerText || '';
+                break;
+            }
+        }
+        const generating = generatingSelectors.some(selector =>
+            Array.from(document.querySelectorAll(selector)).some(el => el.offsetParent !== null));
+        return {count: count, text: text, generating: generating,
+                bodyLength: document.body ? document.body.innerText.length : 0};
+    """
+
+    def __init__(self, first_token_timeout=30, max_wait=180, min_wait=20, stable_for=2.0,
+                 poll_interval=0.5, history=200, response_selectors=None):
+        self.response_selectors = response_selectors or self.RESPONSE_SELECTORS
+        self.first_token_timeout = first_token_timeout
+        self.max_wait = max_wait
+        self.min_wait = min_wait
+        self.stable_for = stable_for
+        self.poll_interval = poll_interval
+        self.first_token_times = deque(maxlen=history)
+        self.complete_times = deque(maxlen=history)
+
+    def poll(self, driver):
+        return driver.execute_script(self.POLL_SCRIPT, self.response_selectors, self.GENERATING_SELECTORS)
+
+    def snapshot(self, driver):
+        """메시지 전송 전 상태 기록 (새 응답 노드를 구분하기 위한 기준값)"""
+        state = self.poll(driver)
+        return state['count'], state['bodyLength']
+
+    def percentile(self, values, pct):
+        ordered = sorted(values)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def adaptive_timeout(self):
+        """최근 완료 시간 분포(p95의 2배)로 계산한 정체 허용 시간 (이 시간 동안 텍스트 변화가 없으면 대기 종료)"""
+        if len(self.complete_times) < 5:
+            return self.max_wait
+        return max(self.min_wait, min(self.max_wait, self.percentile(self.complete_times, 95) * 2))
+
+    def summary(self):
+        """첫 토큰/완료 시간 분포 요약"""
+        return {
+            'samples': len(self.complete_times),
+            'first_token_p50': self.percentile(self.first_token_times, 50),
+            'first_token_p95': self.percentile(self.first_token_times, 95),
+            'complete_p50': self.percentile(self.complete_times, 50),
+            'complete_p95': self.percentile(self.complete_times, 95),
+        }
+
+    def wait(self, driver, baseline, cancel_event=None, on_progress=None):
+        """응답 생성이 끝날 때까지 대기하고 (텍스트, 시간 기록)을 반환 (on_progress로 중간 텍스트 전달)"""
+        baseline_count, baseline_length = baseline
+        cancel_event = cancel_event or threading.Event()
+        started = time.time()
+        # 응답이 계속 늘어나는 동안에는 max_wait만 상한으로 두고, 적응형 시간은 정체 감지에만 사용한다
+        deadline = started + self.max_wait
+        stall_timeout = self.adaptive_timeout()
+        first_token_at = None
+        last_change = started
+        last_text = None
+
+        while True:
+            state = self.poll(driver)
+            now = time.time()
+            if state['count'] > baseline_count:
+                text = state['text'].strip()
+            else:
+                # 응답 노드를 찾지 못하는 DOM 구조에서는 본문 길이 변화로 진행 상황을 판단한다
+                text = str(state['bodyLength']) if state['bodyLength'] != baseline_length else ""
+
+            if text != last_text:
+                last_text = text
+                last_change = now
+                if on_progress and state['count'] > baseline_count and text:
+                    on_progress(text)
+            if text and first_token_at is None:
+                first_token_at = now
+
+            if first_token_at is None:
+                if now - started > self.first_token_timeout:
+                    logger.warning(f"{self.first_token_timeout}초 동안 응답이 시작되지 않았습니다.")
+                    break
+            elif not state['generating'] and now - last_change >= self.stable_for:
+                break
+            elif now - last_change > stall_timeout:
+                logger.warning(f"{stall_timeout:.0f}초 동안 응답이 바뀌지 않아 응답 대기를 종료합니다.")
+                break
+            if now > deadline:
+                logger.warning(f"최대 대기 시간({deadline - started:.0f}초)에 도달하여 응답 대기를 종료합니다.")
+                break
+            if cancel_event.wait(self.poll_interval):
+                break
+
+        timings = {
+            'first_token': round(first_token_at - started, 2) if first_token_at else None,
+            'complete': round(time.time() - started, 2),
+        }
+        if first_token_at and not cancel_event.is_set():
+            self.first_token_times.append(timings['first_token'])
+            self.complete_times.append(timings['complete'])
+        logger.info(f"응답 대기 완료 (첫 토큰: {timings['first_token']}초, 완료: {timings['complete']}초)")
+        return (state['text'] if state['count'] > baseline_count else None), timings
+
+class ResponseExtractor:
+    """최신 모델 응답 노드만 찾아 구조화된 블록(제목, 목록, 문단, 링크)으로 추출하는 추출기"""
+    # 응답 노드 탐색과 블록 변환을 페이지 안에서 처리하여 한 번의 호출로 결과만 받는다
+    EXTRACT_SCRIPT = """
+        const selectors = arguments[0];
+        const clean = text => (text || '').replace(/\\s+\\n/g, '\\n').trim();
+        // 복사/좋아요 같은 버튼과 아이콘은 응답 내용이 아니므로 건너뛴다
+        const isControl = el => ['button', 'mat-icon', 'svg'].includes(el.tagName.toLowerCase())
+            || el.getAttribute('role') === 'button' || el.getAttribute('aria-hidden') === 'true';
+        function walk(element, blocks) {
+            for (const child of element.children) {
+                const tag = child.tagName.toLowerCase();
+                if (isControl(child)) continue;
+                if (/^h[1-6]$/.test(tag)) {
+                    blocks.push({type: 'heading', level: Number(tag[1]), text: clean(child.innerText)});
+                } else if (tag === 'ul' || tag === 'ol') {
+                    for (const item of child.children) {
+                        if (item.tagName.toLowerCase() === 'li') {
+                            blocks.push({type: 'list_item', ordered: tag === 'ol', text: clean(item.innerText)});
+                        }
+                    }
+                } else if (tag === 'pre') {
+                    blocks.push({type: 'code', text: child.innerText});
+                } else if (tag === 'p' || tag === 'table' || tag === 'blockquote' || !child.children.length) {
+                    const text = clean(child.innerText);
+                    if (text) blocks.push({type: 'paragraph', text: text});
+                } else {
+                    walk(child, blocks);
+                }
+            }
+            return blocks;
+        }
+        for (const selector of selectors) {
+            const nodes = document.querySelectorAll(selector);
+            if (!nodes.length) continue;
+            const node = nodes[nodes.length - 1];
+            const text = clean(node.innerText);
+            if (!text) continue;
+            const blocks = walk(node, []);
+            const links = Array.from(node.querySelectorAll('a[href]'))
+                .map(a => ({text: clean(a.innerText), href: a.href}))
+                .filter(link => link.text);
+            return {selector: selector, text: text,
+                    blocks: blocks.length ? blocks : [{type: 'paragraph', text: text}], links: links};
+        }
+        return null;
+    """
+
+    # 응답 본문만 감싸는 가장 안쪽 노드 (model-response 같은 바깥 노드에는 버튼 등 UI가 함께 있다)
+    CONTENT_SELECTORS = [".model-response-text", "message-content"]
+
+    def __init__(self, selectors=None):
+        selectors = selectors or ResponseCompletionDetector.RESPONSE_SELECTORS
+        self.selectors = self.CONTENT_SELECTORS + [s for s in selectors if s not in self.CONTENT_SELECTORS]
+        self.last_selector = None
+
+    def ordered_selectors(self):
+        """마지막으로 성공한 선택자를 먼저 시도"""
+        if self.last_selector in self.selectors:
+            return [self.last_selector] + [s for s in self.selectors if s != self.last_selector]
+        return self.selectors
+
+    def extract(self, driver):
+        """최신 응답 노드의 구조화된 내용 추출 (찾지 못하면 None)"""
+        result = driver.execute_script(self.EXTRACT_SCRIPT, self.ordered_selectors())
+        if result:
+            if result['selector'] != self.last_selector:
+                logger.info(f"응답 노드 선택자: {result['selector']}")
+            self.last_selector = result['selector']
+        return result
+
+    @staticmethod
+    def blocks_to_text(blocks):
+        """구조화된 블록을 줄 단위 텍스트로 변환"""
+        lines = []
+        number = 0
+        for block in blocks:
+            if block['type'] == 'list_item':
+                number = number + 1 if block.get('ordered') else 0
+                lines.append(f"{number}. {block['text']}" if block.get('ordered') else f"• {block['text']}")
+                continue
+            number = 0
+            if block['type'] == 'heading':
+                lines.append(f"\n{block['text']}")
+            else:
+                lines.append(block['text'])
+        return '\n'.join(lines).strip()
+
+class SelectorResolver:
+    """후보 선택자를 한 번의 JS 호출로 검사하여 화면에 보이고 활성화된 첫 요소를 찾는 해석기"""
+    RESOLVE_SCRIPT = """
+        const selectors = arguments[0];
+        const version = (window.WIZ_global_data && window.WIZ_global_data.cfb2h) || location.host;
+        for (const selector of selectors) {
+            let nodes;
+            try {
+                nodes = document.querySelectorAll(selector);
+            } catch (e) {
+                continue;  // 브라우저가 지원하지 않는 선택자 (예: :has)
+            }
+            for (const el of nodes) {
+                const style = window.getComputedStyle(el);
+                const visible = el.getClientRects().length > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+                const enabled = !el.disabled && el.getAttribute('aria-disabled') !== 'true';
+                if (visible && enabled) return {element: el, selector: selector, version: version};
+            }
+        }
+        return {element: null, selector: null, version: version};
+    """
+
+    def __init__(self):
+        self.winners = {}
+        self.page_version = None
+        self.lock = threading.Lock()
+
+    def resolve(self, driver, name, selectors):
+        """(요소, 선택자) 반환 (현재 페이지 버전에서 이전에 성공한 선택자를 먼저 시도)"""
+        with self.lock:
+            cached = self.winners.get((name, self.page_version))
+        ordered = [cached] + [s for s in selectors if s != cached] if cached in selectors else list(selectors)
+
+        result = driver.execute_script(self.RESOLVE_SCRIPT, ordered)
+        with self.lock:
+            self.page_version = result['version']
+            selector_lookups.inc(name=name, result='hit' if cached and result['selector'] == cached else 'miss')
+            if result['selector']:
+                self.winners[(name, result['version'])] = result['selector']
+        return result['element'], result['selector']
+
+class GeminiNewsScraper:
+    def __init__(self, driver_pool=None, profile_manager=None, detector=None, store=None, user_id=None,
+                 extractor=None, resolver=None):
+        self.driver = None
+        self.resolver = resolver or SelectorResolver()
+        self.extractor = extractor or ResponseExtractor()
+        self.extraction = None
+        self.store = store or JsonFileResponseStore()
+        self.user_id = user_id
+        self.wait = None
+        self.detector = detector or ResponseCompletionDetector()
+        self.timings = None
+        self.phases = {}
+        self.driver_pool = driver_pool
+        self.session = None
+        self.profile_manager = profile_manager
+        self.profile_dir = None
+        self.cancel_event = threading.Event()
+        self.failure = None
+        # 재시도할 때 이전 시도에서 실패한 세션을 피하기 위한 기록
+        self.avoid_sessions = ()
+        self.used_session = None
+
+    def cancel(self):
+        """진행 중인 스크래핑 취소 요청 (다음 단계에서 중단)"""
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        """취소 요청이 있으면 예외 발생"""
+        if self.cancel_event.is_set():
+            raise ScrapeCancelledError("스크래핑이 취소되었습니다.")
+        
+    def setup_driver(self):
+        """Chrome 드라이버 설정"""
+        if self.profile_manager:
+            self.profile_dir = self.profile_manager.acquire()
+            self.driver = create_chrome_driver(self.profile_dir)
+        else:
+            self.driver = create_chrome_driver()
+        self.wait = WebDriverWait(self.driver, 30)
+        
+    def access_gemini(self, lang='ko', region='KR'):
+        """Gemini 웹사이트 접속 (언어 및 지역 설정 포함)"""
+        try:
+            logger.info(f"Gemini 웹사이트에 접속 중... (언어: {lang}, 지역: {region})")
+            self.driver.get(gemini_url(lang, region))
+            wait_for_page_ready(self.driver)
+            logger.info("페이지 로딩 완료")
+            
+        except Exception as e:
+            logger.error(f"웹사이트 접속 중 오류: {e}")
+            raise
+            
+    def find_textarea(self):
+        """입력창 찾기"""
+        textarea_selectors = [
+            "textarea",
+            "[contenteditable='true']",
+            "input[type='text']",
+            "[data-testid*='input']",
+            "[placeholder*='message']",
+            "[placeholder*='질문']",
+            ".input-area textarea",
+            "#prompt-textarea"
+        ]
+        
+        element, selector = self.resolver.resolve(self.driver, "textarea", textarea_selectors)
+        if element:
+            logger.info(f"입력창을 찾았습니다: {selector}")
+        return element
+        
+    def send_message(self, textarea):
+        """메시지 전송"""
+        try:
+            from selenium.webdriver.common.keys import Keys
+            textarea.send_keys(Keys.RETURN)
+            logger.info("Enter 키로 전송했습니다.")
+            return
+        except:
+            pass
+            
+        send_button_selectors = [
+            "button[aria-label*='Send']",
+            "button[aria-label*='전송']",
+            "[data-testid*='send']",
+            "button[type='submit']",
+            ".send-button",
+            "button:has(svg)"
+        ]
+        
+        try:
+            button, selector = self.resolver.resolve(self.driver, "send_button", send_button_selectors)
+            if button:
+                button.click()
+                logger.info(f"전송 버튼을 클릭했습니다: {selector}")
+                return
+        except Exception:
+            pass
+                
+        # 마지막 시도
+        textarea.send_keys(Keys.RETURN)
+        
+    def get_response_text(self):
+        """응답 텍스트 추출 (최신 응답 노드 우선, 찾지 못하면 페이지 본문에서 추출)"""
+        try:
+            self.extraction = self.extractor.extract(self.driver)
+            if self.extraction:
+                response_text = self.extractor.blocks_to_text(self.extraction['blocks'])
+                logger.info(f"응답 추출 완료 (길이: {len(response_text)} 문자, 블록: {len(self.extraction['blocks'])}개)")
+                return response_text
+            logger.warning("응답 노드를 찾지 못해 페이지 본문에서 추출합니다.")
+        except Exception as e:
+            logger.warning(f"응답 노드 추출 실패, 페이지 본문에서 추출합니다: {e}")
+
+        try:
+            body_text = self.driver.find_element(By.TAG_NAME, "body").text
+            lines = body_text.split('\n')
+            response_lines = []
+            
+            collecting = False
+            for line in lines:
+                if any(keyword in line for keyword in ['뉴스', 'News', '오늘', '주요']):
+                    collecting = True
+                    
+                if collecting and line.strip():
+                    response_lines.append(line.strip())
+                    
+            if response_lines:
+                response_text = '\n'.join(response_lines)
+                logger.info(f"응답 추출 완료 (길이: {len(response_text)} 문자)")
+                return response_text
+            else:
+                logger.warning("뉴스 관련 응답을 찾을 수 없어 전체 페이지 텍스트를 반환합니다.")
+                return body_text
+                
+        except Exception as e:
+            logger.error(f"응답 텍스트 추출 중 오류: {e}")
+            return "응답 추출 실패"
+            
+    def save_response(self, response_text, prompt="오늘의 주요 뉴스 알려줘", lang='ko', region='KR'):
+        """응답을 저장소에 저장하고 (참조, 데이터) 반환"""
+        data = {
+            "timestamp": datetime.now().isoformat(),
+            "prompt": prompt,
+            "response": response_text,
+            "source": "Gemini AI",
+            "lang": lang,
+            "region": region,
+        }
+        if self.timings or self.phases:
+            data["timings"] = {**self.phases, **(self.timings or {})}
+        if self.extraction:
+            data["blocks"] = self.extraction['blocks']
+            data["links"] = self.extraction['links']
+        return self.store.save(data, self.user_id), data
+            
+    def run(self, custom_prompt="오늘의 주요 뉴스 알려줘", lang='ko', region='KR', on_progress=None):
+        """메인 실행 함수 (on_progress를 주면 생성 중인 응답 텍스트를 중간중간 전달)"""
+        healthy = True
+        try:
+            logger.info("=== Gemini 스크래퍼 시작 ===")
+            
+            self.check_cancelled()
+            if self.driver_pool:
+                with metrics.timer('driver_acquire', self.phases):
+                    try:
+                        self.session = self.driver_pool.checkout(lang, region, exclude=self.avoid_sessions)
+                        self.used_session = self.session
+                    except WebDriverException as e:
+                        raise classify_scrape_error(e, NavigationError) from e
+                self.driver = self.session.driver
+                self.wait = WebDriverWait(self.driver, 30)
+            else:
+                with metrics.timer('driver_acquire', self.phases):
+                    try:
+                        self.setup_driver()
+                    except Exception as e:
+                        raise classify_scrape_error(e, DriverCrashError) from e
+                with metrics.timer('access_gemini', self.phases):
+                    try:
+                        self.access_gemini(lang, region)
+                    except Exception as e:
+                        raise classify_scrape_error(e, NavigationError) from e
+            self.check_cancelled()
+            
+            logger.info(f"프롬프트 입력 중: {custom_prompt}")
+            with metrics.timer('input_discovery', self.phases):
+                textarea = self.find_textarea()
+            if not textarea:
+                raise InputNotFoundError("입력창을 찾을 수 없습니다.")
+            
+            baseline = self.detector.snapshot(self.driver)
+            with metrics.timer('send', self.phases):
+                try:
+                    textarea.clear()
+                    textarea.send_keys(custom_prompt)
+                    self.send_message(textarea)
+                except Exception as e:
+                    raise classify_scrape_error(e, InputNotFoundError) from e
+            
+            logger.info("응답을 기다리는 중...")
+            _, self.timings = self.detector.wait(self.driver, baseline, self.cancel_event, on_progress)
+            metrics.observe_phase('first_token', self.timings['first_token'])
+            metrics.observe_phase('completion', self.timings['complete'])
+            self.check_cancelled()
+            if self.timings['first_token'] is None:
+                raise EmptyResponseError("응답이 시작되지 않았습니다.")
+            
+            with metrics.timer('extraction', self.phases):
+                response_text = self.get_response_text()
+            if not response_text or response_text == "응답 추출 실패":
+                raise EmptyResponseError("응답을 받지 못했습니다.")
+            
+            filename, data = self.save_response(response_text, custom_prompt, lang, region)
+            logger.info("=== 작업 완료 ===")
+            return filename, data
+            
+        except ScrapeCancelledError:
+            logger.warning("요청이 만료되어 스크래핑을 중단합니다.")
+            return None, None
+        except Exception as e:
+            self.failure = classify_scrape_error(e)
+            logger.error(f"오류 발생 ({self.failure.kind}): {e}")
+            healthy = not self.failure.session_broken
+            return None, None
+        finally:
+            if self.session:
+                self.driver_pool.checkin(self.session, healthy)
+                self.session = None
+            elif self.driver:
+                self.driver.quit()
+            if self.profile_dir:
+                self.profile_manager.release(self.profile_dir)
+                self.profile_dir = None
+
+class ScrapeExecutor:
+    """블로킹 스크래핑 작업을 워커 풀에서 실행하고 이벤트 루프에서 기다리는 실행기"""
+    def __init__(self, max_workers=2, max_queue=10, timeout=180):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scraper")
+
+    def queue_position(self):
+        """새 요청이 들어왔을 때의 대기 순번 (0이면 즉시 실행)"""
+        return max(0, self.pending - self.max_workers + 1)
+
+    async def run(self, scraper, *args, low_priority=False):
+        """스크래퍼를 워커 풀에서 실행 (대기열 초과 시 ScraperBusyError, 시간 초과 시 취소)
+
+        low_priority 작업은 대화형 요청을 위해 워커 하나를 항상 비워 두고, 대기열에 들어가지 않는다.
+        """
+        if low_priority and self.pending >= max(1, self.max_workers - 1):
+            raise ScraperBusyError(self.queue_position())
+        if self.pending >= self.max_workers + self.max_queue:
+            raise ScraperBusyError(self.queue_position())
+
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(scraper.run, *args)
+        self.pending += 1
+        # 기다리던 요청이 포기해도 워커 스레드가 실제로 끝날 때까지는 대기열 깊이에 포함한다
+        future.add_done_callback(lambda _: self.notify_done(loop))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # 대기 중인 작업은 wait_for가 취소하고, 실행 중인 작업은 다음 단계에서 중단된다
+            scraper.cancel()
+            raise
+
+    def notify_done(self, loop):
+        """작업 종료 시 워커 스레드에서 호출 (pending은 이벤트 루프에서만 변경)"""
+        try:
+            loop.call_soon_threadsafe(self.task_done)
+        except RuntimeError:
+            # 이벤트 루프가 이미 닫혔으면 더 이상 대기열을 볼 곳이 없다
+            pass
+
+    def task_done(self):
+        self.pending -= 1
+
+    def shutdown(self):
+        """워커 풀 종료 (대기 중인 작업은 취소)"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class ResponseCache:
+    """TTL과 크기 제한(LRU)이 있는 응답 캐시 (동일 요청이 동시에 오면 하나의 스크래핑으로 병합)"""
+    def __init__(self, ttl=1800, max_entries=256, path=None, store=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.store = store
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.load()
+
+    @staticmethod
+    def make_key(prompt, lang, region, date=None):
+        """정규화된 프롬프트와 언어/지역/날짜로 캐시 키 생성"""
+        normalized = ' '.join(prompt.split()).lower()
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        return f"{lang}|{region}|{date}|{normalized}"
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (time.time() + self.ttl, value)
+        self.entries.move_to_end(key)
+        evicted = []
+        while len(self.entries) > self.max_entries:
+            evicted.append(self.entries.popitem(last=False)[0])
+        self.save(key, evicted)
+
+    def expires_in(self, key):
+        """항목이 만료되기까지 남은 시간(초), 없으면 0"""
+        entry = self.entries.get(key)
+        return max(0, entry[0] - time.time()) if entry else 0
+
+    async def get_or_fetch(self, key, fetch, force=False):
+        """캐시에 있으면 바로 반환하고, 없으면 fetch() 결과를 캐시 (반환값: (값, 캐시 사용 여부))
+
+        force=True이면 캐시를 무시하고 새로 가져오되, 진행 중인 동일 요청과는 병합한다.
+        """
+        value = None if force else self.get(key)
+        if value is not None:
+            return value, True
+        if key in self.inflight:
+            return await asyncio.shield(self.inflight[key]), True
+
+        future = asyncio.get_running_loop().create_future()
+        # 기다리는 요청이 없을 때 예외가 처리되지 않았다는 경고를 막는다
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.inflight[key] = future
+        try:
+            value = await fetch()
+            if value is not None:
+                self.set(key, value)
+            future.set_result(value)
+            return value, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self.inflight[key]
+
+    def load(self):
+        """디스크에 저장된 캐시 복원 (만료된 항목 제외)"""
+        if self.store:
+            try:
+                for key, expires_at, value in self.store.cache_load()[-self.max_entries:]:
+                    self.entries[key] = (expires_at, value)
+                logger.info(f"응답 캐시 {len(self.entries)}건을 복원했습니다.")
+            except Exception as e:
+                logger.warning(f"응답 캐시 복원 실패: {e}")
+            return
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            now = time.time()
+            for key, (expires_at, value) in stored.items():
+                if expires_at > now:
+                    self.entries[key] = (expires_at, value)
+            logger.info(f"응답 캐시 {len(self.entries)}건을 복원했습니다.")
+        except Exception as e:
+            logger.warning(f"응답 캐시 복원 실패: {e}")
+
+    def save(self, key, evicted=()):
+        """변경된 항목을 디스크에 반영 (저장소는 항목 단위, 파일은 전체 기록)"""
+        if self.store:
+            try:
+                self.store.cache_set(key, *self.entries[key])
+                if evicted:
+                    self.store.cache_delete(evicted)
+            except Exception as e:
+                logger.warning(f"응답 캐시 저장 실패: {e}")
+            return
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"응답 캐시 저장 실패: {e}")
+
+class PromptSimilarityIndex:
+    """최근 /msg 질문과 답변의 유사 질문 색인 (문자 n-gram MinHash + LSH, 언어/지역별, TTL과 LRU 제한)
+
+    후보는 LSH 버킷으로 찾고, 실제 n-gram 집합의 자카드 유사도가 임계값 이상일 때만 사용한다.
+    숫자(연도, 금액 등)가 다르거나, 띄어쓰기와 작은 오타를 제외하고 다른 단어가 있으면(미국/중국 등) 다른 질문으로 본다.
+    """
+    FILLER_WORDS = {'좀', '혹시', '제발', '그럼', 'please', 'pls', 'plz'}
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, ttl=1800, max_entries=1000, threshold=0.85, num_perm=64, bands=16, ngram=3, seed=1):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self.perms = [(rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME)) for _ in range(num_perm)]
+        self.entries = OrderedDict()
+        self.buckets = {}
+
+    def normalize(self, prompt):
+        """NFKC 정규화, 소문자화, 문장 부호와 군더더기 단어 제거"""
+        text = re.sub(r'[^\w\s]', ' ', unicodedata.normalize('NFKC', prompt).lower())
+        return ' '.join(token for token in text.split() if token not in self.FILLER_WORDS)
+
+    def shingles(self, normalized):
+        """띄어쓰기 차이를 무시한 문자 n-gram 집합"""
+        text = normalized.replace(' ', '')
+        if len(text) <= self.ngram:
+            return {text}
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    @staticmethod
+    def edit_distance(a, b):
+        """인접 문자 바꿈을 한 번의 편집으로 보는 편집 거리 (OSA)"""
+        prev2, prev = None, list(range(len(b) + 1))
+        for i in range(1, len(a) + 1):
+            row = [i] + [0] * len(b)
+            for j in range(1, len(b) + 1):
+                row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+                if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                    row[j] = min(row[j], prev2[j - 2] + 1)
+            prev2, prev = prev, row
+        return prev[-1]
+
+    def same_tokens(self, tokens, other):
+        """군더더기 단어를 뺀 두 질문의 단어가 띄어쓰기 차이와 작은 오타를 제외하고 같은지 확인
+
+        다른 부분은 4글자마다 한 번의 편집까지만 오타로 보므로, 짧은 고유명사가 바뀌면(미국/중국) 다른 질문이다.
+        """
+        matcher = difflib.SequenceMatcher(None, tokens, other, autojunk=False)
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == 'equal':
+                continue
+            a, b = ''.join(tokens[i1:i2]), ''.join(other[j1:j2])
+            if self.edit_distance(a, b) > min(len(a), len(b)) // 4:
+                return False
+        return True
+
+    def signature(self, shingles):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') for s in shingles]
+        return [min((a * h + b) % self.PRIME for h in hashes) for a, b in self.perms]
+
+    def band_keys(self, scope, signature):
+        return [(scope, i, tuple(signature[i * self.rows:(i + 1) * self.rows])) for i in range(self.bands)]
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id)
+        for key in entry['bands']:
+            bucket = self.buckets.get(key)
+            if bucket:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def evict(self):
+        """만료된 항목과 크기 제한을 넘은 오래된 항목 제거"""
+        now = time.time()
+        for entry_id in [k for k, e in self.entries.items() if e['expires_at'] < now]:
+            self.remove(entry_id)
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def add(self, prompt, lang, region, value):
+        """답변을 색인에 추가"""
+        if self.ttl <= 0:
+            return
+        normalized = self.normalize(prompt)
+        if not normalized:
+            return
+        shingles = self.shingles(normalized)
+        bands = self.band_keys((lang, region), self.signature(shingles))
+        entry_id = uuid.uuid4().hex
+        self.entries[entry_id] = {
+            'shingles': shingles,
+            'tokens': normalized.split(),
+            'numbers': re.findall(r'\d+', normalized),
+            'bands': bands,
+            'expires_at': time.time() + self.ttl,
+            'value': value,
+        }
+        for key in bands:
+            self.buckets.setdefault(key, set()).add(entry_id)
+        self.evict()
+
+    def lookup(self, prompt, lang, region):
+        """같은 언어/지역에서 충분히 비슷한 질문의 답변과 유사도 반환 (없으면 None)"""
+        if self.ttl <= 0 or not self.entries:
+            return None
+        self.evict()
+        normalized = self.normalize(prompt)
+        if not normalized:
+            return None
+        shingles = self.shingles(normalized)
+        tokens = normalized.split()
+        numbers = re.findall(r'\d+', normalized)
+        candidates = set()
+        for key in self.band_keys((lang, region), self.signature(shingles)):
+            candidates |= self.buckets.get(key, set())
+
+        best_id, best_score = None, 0.0
+        for entry_id in candidates:
+            entry = self.entries[entry_id]
+            if entry['numbers'] != numbers:
+                continue
+            score = len(shingles & entry['shingles']) / len(shingles | entry['shingles'])
+            if score > best_score and score >= self.threshold and self.same_tokens(tokens, entry['tokens']):
+                best_id, best_score = entry_id, score
+        if best_id is None or best_score < self.threshold:
+            return None
+        self.entries.move_to_end(best_id)
+        return self.entries[best_id]['value'], best_score
+
+class NewsPrefetcher:
+    """사용 중인 (언어, 지역) 조합의 뉴스를 주기적으로 미리 가져와 캐시를 데워 두는 스케줄러"""
+    def __init__(self, bot, interval=1800, times=(), active_hours=24):
+        self.bot = bot
+        self.interval = interval
+        self.times = times
+        self.active_hours = active_hours
+        self.task = None
+
+    async def active_pairs(self):
+        """사용자 설정과 최근 /news 요청에 등장한 (언어, 지역) 조합"""
+        cutoff = time.time() - self.active_hours * 3600
+        pairs = {('ko', 'KR')}
+        # 저장된 설정 전체를 조회하므로 이벤트 루프 밖에서 실행한다
+        pairs.update(await asyncio.to_thread(self.bot.settings_store.active_pairs))
+        pairs.update(pair for pair, last_seen in self.bot.recent_news_pairs.items() if last_seen >= cutoff)
+        return sorted(pairs)
+
+    def seconds_until_next_run(self):
+        """다음 주기 실행과 지정 시각 중 가장 가까운 시점까지 남은 시간"""
+        now = datetime.now()
+        candidates = [self.interval] if self.interval > 0 else []
+        for hhmm in self.times:
+            hour, minute = map(int, hhmm.split(':'))
+            target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            delta = (target - now).total_seconds()
+            candidates.append(delta if delta > 0 else delta + 86400)
+        return min(candidates) if candidates else None
+
+    async def prefetch(self, lang, region):
+        """만료가 임박한 항목만 우선순위 낮은 작업으로 새로 가져와 캐시에 저장"""
+        prompt = self.bot.news_prompt(region)
+        key = ResponseCache.make_key(prompt, lang, region)
+        if self.bot.news_cache.expires_in(key) > self.interval:
+            return
+
+        async def fetch_news():
+            _, data = await self.bot.scrape(prompt, lang, region, low_priority=True, command='news')
+            return data
+
+        try:
+            data, _ = await self.bot.news_cache.get_or_fetch(key, fetch_news, force=True)
+            logger.info(f"뉴스 미리 가져오기 {'완료' if data else '실패'} (언어: {lang}, 지역: {region})")
+        except ScraperBusyError:
+            logger.info(f"스크래퍼가 사용 중이어서 미리 가져오기를 건너뜁니다. (언어: {lang}, 지역: {region})")
+        except Exception as e:
+            logger.warning(f"뉴스 미리 가져오기 중 오류: {e}")
+
+    async def run(self):
+        while True:
+            delay = self.seconds_until_next_run()
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+            for lang, region in await self.active_pairs():
+                await self.prefetch(lang, region)
+
+    def start(self):
+        if self.interval > 0 or self.times:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+class AdmissionRejected(Exception):
+    """요청을 받아들일 수 없을 때 발생하는 예외 (사용자에게 보낼 안내 문구 포함)"""
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+
+class AdmissionTicket:
+    """받아들인 요청 하나 (실행 차례가 되면 ready가 완료된다)"""
+    def __init__(self, user_id, key, position, ready):
+        self.user_id = user_id
+        self.key = key
+        self.position = position
+        self.ready = ready
+
+    async def wait(self):
+        await self.ready
+
+class AdmissionController:
+    """사용자별 토큰 버킷, 전체 동시 실행 한도, 사용자 간 라운드 로빈 대기열로 요청을 받아들이는 관리자"""
+    def __init__(self, capacity=2, max_waiting=10, burst=3, refill_seconds=20, max_per_user=2):
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.max_per_user = max_per_user
+        self.buckets = {}
+        self.running = 0
+        self.waiting = OrderedDict()
+        self.active_keys = set()
+        self.per_user = {}
+
+    @staticmethod
+    def make_key(prompt):
+        return ' '.join(prompt.split()).lower()
+
+    def waiting_count(self):
+        return sum(len(queue) for queue in self.waiting.values())
+
+    def take_token(self, user_id):
+        """토큰 버킷에서 토큰 하나 사용 (부족하면 다시 시도 가능한 시간(초) 반환)"""
+        now = time.time()
+        tokens, updated = self.buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) / self.refill_seconds)
+        if tokens < 1:
+            self.buckets[user_id] = (tokens, now)
+            return (1 - tokens) * self.refill_seconds
+        self.buckets[user_id] = (tokens - 1, now)
+        return 0
+
+    def admit(self, user_id, prompt):
+        """요청 접수 (거절 시 AdmissionRejected, 자리가 없으면 대기열에 넣고 순번이 있는 티켓 반환)"""
+        key = self.make_key(prompt)
+        if (user_id, key) in self.active_keys:
+            raise AdmissionRejected('duplicate', "🔁 같은 요청을 이미 처리하고 있습니다. 잠시만 기다려주세요.")
+        if self.per_user.get(user_id, 0) >= self.max_per_user:
+            raise AdmissionRejected('user_busy', "⏳ 이전 요청을 처리하고 있습니다. 응답을 받은 뒤 다시 요청해주세요.")
+        if self.running >= self.capacity and self.waiting_count() >= self.max_waiting:
+            raise AdmissionRejected('busy', f"⏳ 요청이 많아 처리할 수 없습니다. (대기 {self.waiting_count()}건) 잠시 후 다시 시도해주세요.")
+        retry_after = self.take_token(user_id)
+        if retry_after:
+            raise AdmissionRejected('rate', f"⏳ 요청이 너무 잦습니다. {retry_after:.0f}초 후 다시 시도해주세요.")
+
+        self.active_keys.add((user_id, key))
+        self.per_user[user_id] = self.per_user.get(user_id, 0) + 1
+        ready = asyncio.get_running_loop().create_future()
+        if self.running < self.capacity:
+            self.running += 1
+            ready.set_result(True)
+            return AdmissionTicket(user_id, key, 0, ready)
+        self.waiting.setdefault(user_id, deque()).append(ready)
+        return AdmissionTicket(user_id, key, self.waiting_count(), ready)
+
+    def dispatch(self):
+        """빈 자리를 대기 중인 사용자에게 돌아가며 한 건씩 배정"""
+        while self.running < self.capacity and self.waiting:
+            user_id, queue = self.waiting.popitem(last=False)
+            ready = queue.popleft()
+            if queue:
+                self.waiting[user_id] = queue
+            if ready.done():
+                continue
+            self.running += 1
+            ready.set_result(True)
+
+    def release(self, ticket):
+        """요청 처리 종료 (대기 중에 취소된 요청은 대기열에서 제거)"""
+        self.active_keys.discard((ticket.user_id, ticket.key))
+        self.per_user[ticket.user_id] -= 1
+        if self.per_user[ticket.user_id] <= 0:
+            del self.per_user[ticket.user_id]
+        if ticket.ready.done() and not ticket.ready.cancelled():
+            self.running -= 1
+        else:
+            ticket.ready.cancel()
+            queue = self.waiting.get(ticket.user_id)
+            if queue and ticket.ready in queue:
+                queue.remove(ticket.ready)
+                if not queue:
+                    del self.waiting[ticket.user_id]
+        self.dispatch()
+
+class CircuitBreaker:
+    """최근 실패율이 임계값을 넘으면 요청을 바로 거절하는 차단기
+
+    closed: 정상 / open: open_seconds 동안 모든 요청 거절 / half_open: 시험 요청 하나만 보내
+    성공하면 closed로, 실패하면 다시 open으로 전환한다.
+    """
+    def __init__(self, failure_rate=0.5, min_requests=5, window=20, open_seconds=60):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.results = deque(maxlen=window)
+        self.state = 'closed'
+        self.opened_at = 0
+        self.probing = False
+
+    def allow(self):
+        """요청을 보내도 되는지 확인 (half_open에서는 시험 요청 하나만 허용)"""
+        if self.state == 'open' and time.time() - self.opened_at >= self.open_seconds:
+            self.state = 'half_open'
+        if self.state == 'closed':
+            return True
+        if self.state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record(self, ok):
+        """요청 결과 반영"""
+        if self.state == 'half_open':
+            self.probing = False
+            if ok:
+                logger.info("시험 요청이 성공하여 차단기를 닫습니다.")
+                self.state = 'closed'
+                self.results.clear()
+            else:
+                self.trip()
+            return
+        self.results.append(ok)
+        failures = self.results.count(False)
+        if len(self.results) >= self.min_requests and failures / len(self.results) >= self.failure_rate:
+            self.trip()
+
+    def release(self):
+        """결과 없이 끝난 시험 요청(취소, 대기열 초과)의 자리를 반환"""
+        self.probing = False
+
+    def trip(self):
+        logger.warning(f"실패율이 높아 {self.open_seconds:.0f}초 동안 차단기를 엽니다.")
+        self.state = 'open'
+        self.opened_at = time.time()
+        self.probing = False
+
+class BrowserBackend:
+    """Selenium 스크래퍼를 워커 풀에서 실행하는 백엔드 (재시도할 만한 실패는 다른 세션으로 다시 시도)"""
+    name = "browser"
+
+    def __init__(self, executor, scraper_factory, max_attempts=2, retry_delay=1.0):
+        self.executor = executor
+        self.scraper_factory = scraper_factory
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    async def generate(self, prompt, lang, region, on_progress=None, low_priority=False, user_id=None, target=None):
+        started = time.time()
+        failed_sessions = set()
+        for attempt in range(1, self.max_attempts + 1):
+            scraper = self.scraper_factory(user_id)
+            scraper.avoid_sessions = failed_sessions
+            ref, data = await self.executor.run(scraper, prompt, lang, region, on_progress, low_priority=low_priority)
+            failure = scraper.failure
+            if data or failure is None:
+                return ref, data
+            scrape_failures.inc(kind=failure.kind)
+            if scraper.used_session:
+                failed_sessions.add(scraper.used_session)
+            # 요청 시간 제한의 절반을 넘게 쓴 뒤에는 다시 시도하지 않는다
+            if not failure.retryable or attempt == self.max_attempts or time.time() - started > self.executor.timeout / 2:
+                break
+            # 실패한 세션은 폐기되거나, 초기화 후 풀에 돌아와도 다른 세션을 쓸 수 없을 때만 다시 사용된다
+            delay = self.retry_delay * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            logger.warning(f"스크래핑 실패({failure.kind}), {delay:.1f}초 후 다시 시도합니다. ({attempt}/{self.max_attempts})")
+            await asyncio.sleep(delay)
+        return None, None
+
+    async def close(self):
+        pass
+
+class GeminiApiBackend:
+    """Gemini API를 직접 호출하는 백엔드 (연결 풀 재사용, 스트리밍 응답)"""
+    name = "api"
+
+    def __init__(self, api_key, model="gemini-2.0-flash", base_url="https://generativelanguage.googleapis.com",
+                 timeout=60, max_connections=20, use_search=True, store=None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.use_search = use_search
+        self.store = store or JsonFileResponseStore()
+        self.client = None
+
+    def get_client(self):
+        """이벤트 루프 안에서 연결 풀을 한 번만 생성하여 재사용"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=10),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                headers={"x-goog-api-key": self.api_key},
+            )
+        return self.client
+
+    def build_request(self, prompt, lang, region):
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "systemInstruction": {"parts": [{"text": f"Answer in the language '{lang}'. The user is in region '{region}'."}]},
+        }
+        if self.use_search:
+            # 최신 뉴스를 답할 수 있도록 Google 검색 그라운딩 사용
+            body["tools"] = [{"google_search": {}}]
+        return body
+
+    async def generate(self, prompt, lang, region, on_progress=None, low_priority=False, user_id=None, target=None):
+        started = time.time()
+        first_token_at = None
+        text = ""
+        async with self.get_client().stream(
+            "POST", f"/v1beta/models/{self.model}:streamGenerateContent",
+            params={"alt": "sse"}, json=self.build_request(prompt, lang, region),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[5:])
+                for candidate in chunk.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        text += part.get("text", "")
+                if text and first_token_at is None:
+                    first_token_at = time.time()
+                if on_progress and text:
+                    on_progress(text)
+
+        completed_at = time.time()
+        metrics.observe_phase('first_token', first_token_at - started if first_token_at else None)
+        metrics.observe_phase('completion', completed_at - started)
+        if not text.strip():
+            logger.error("Gemini API 응답이 비어 있습니다.")
+            return None, None
+        data = {
+            "timestamp": datetime.now().isoformat(),
+            "prompt": prompt,
+            "response": text.strip(),
+            "source": "Gemini API",
+            "lang": lang,
+            "region": region,
+            "timings": {
+                "first_token": round(first_token_at - started, 2) if first_token_at else None,
+                "complete": round(completed_at - started, 2),
+            },
+        }
+        ref = await asyncio.to_thread(self.store.save, data, user_id)
+        return ref, data
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+class SqliteJobQueue:
+    """봇과 스크래퍼 워커 프로세스가 함께 쓰는 SQLite(WAL) 작업 대기열
+
+    워커는 작업을 임대(lease)해 실행하고 하트비트로 임대를 연장한다. 워커가 죽어 임대가 만료되면
+    다른 워커가 작업을 다시 가져가므로 작업은 최소 한 번 실행된다. (max_attempts를 넘거나 기한이 지나면 실패)
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            chat_id INTEGER,
+            message_id INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            worker_id TEXT,
+            lease_expires REAL,
+            deadline REAL NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_delivered ON jobs(delivered, status);
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            host TEXT,
+            pid INTEGER,
+            heartbeat_at REAL NOT NULL,
+            current_job TEXT,
+            jobs_done INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, path="data/jobs.db", lease_seconds=30, max_attempts=2):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        # 여러 프로세스가 같은 파일을 쓰므로 잠금 대기 시간을 두고, 트랜잭션은 직접 시작한다
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        # 우선순위 열이 생기기 전에 만든 대기열 파일에는 열을 추가한다
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if 'priority' not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority, created_at)")
+
+    @contextmanager
+    def transaction(self):
+        """쓰기 잠금을 먼저 잡는 트랜잭션 (다른 프로세스와 같은 작업을 동시에 가져가지 않도록)"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    @staticmethod
+    def decode(row):
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        if job['result']:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def enqueue(self, payload, chat_id=None, message_id=None, timeout=180, job_id=None, low_priority=False):
+        """작업 추가 후 작업 ID 반환 (timeout초가 지나도록 끝나지 않으면 실패 처리)
+
+        low_priority 작업(미리 가져오기)은 대기 중인 일반 작업이 모두 임대된 뒤에만 워커가 가져간다.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, chat_id, message_id, max_attempts, priority, deadline, "
+                "created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), chat_id, message_id, self.max_attempts,
+                 1 if low_priority else 0, now + timeout, now, now),
+            )
+        return job_id
+
+    def expire(self, conn, now):
+        """기한이 지난 작업과, 임대가 만료된 채 재시도 횟수를 다 쓴 작업을 실패 처리"""
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = '작업 기한 초과', updated_at = ? "
+            "WHERE status IN ('queued', 'running') AND deadline < ?", (now, now),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = '워커 응답 없음', updated_at = ? "
+            "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts", (now, now),
+        )
+
+    def claim(self, worker_id):
+        """대기 중이거나 임대가 만료된 작업 중 우선순위가 높고 가장 오래된 작업을 임대 (없으면 None)"""
+        now = time.time()
+        with self.transaction() as conn:
+            self.expire(conn, now)
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY priority, created_at LIMIT 1", (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?", (worker_id, now + self.lease_seconds, now, row['id']),
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+        return self.decode(job)
+
+    def heartbeat(self, worker_id, job_id=None, progress=None):
+        """워커 생존 신호 (작업 중이면 임대 연장, 다른 워커에게 작업이 넘어갔으면 False 반환)"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO workers (worker_id, host, pid, heartbeat_at, current_job) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at, "
+                "current_job = excluded.current_job",
+                (worker_id, os.uname().nodename, os.getpid(), now, job_id),
+            )
+            if job_id is None:
+                return True
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, progress = COALESCE(?, progress), updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + self.lease_seconds, progress, now, job_id, worker_id),
+            ).rowcount
+        return updated > 0
+
+    def complete(self, job_id, worker_id, result):
+        """작업 결과 저장 (임대를 잃은 워커의 결과는 무시)"""
+        now = time.time()
+        with self.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, progress = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (json.dumps(result, ensure_ascii=False), now, job_id, worker_id),
+            ).rowcount
+            conn.execute(
+                "UPDATE workers SET jobs_done = jobs_done + 1, current_job = NULL WHERE worker_id = ?", (worker_id,)
+            )
+        return updated > 0
+
+    def fail(self, job_id, worker_id, error, retry=False):
+        """작업 실패 기록 (retry이고 재시도 횟수가 남았으면 다시 대기열로)"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "error = ?, worker_id = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (retry, error, now, job_id, worker_id),
+            )
+            conn.execute("UPDATE workers SET current_job = NULL WHERE worker_id = ?", (worker_id,))
+
+    def poll(self, job_ids):
+        """작업 상태 조회 ({작업 ID: 작업})"""
+        if not job_ids:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})", list(job_ids)
+            ).fetchall()
+        return {row['id']: self.decode(row) for row in rows}
+
+    def undelivered(self, limit=20):
+        """끝났지만 아직 사용자에게 전달되지 않은 작업 목록"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE delivered = 0 AND status IN ('done', 'failed') ORDER BY updated_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [self.decode(row) for row in rows]
+
+    def claim_delivery(self, job_id):
+        """결과 전달 권한 획득 (이미 다른 곳에서 전달했으면 False)"""
+        with self.transaction() as conn:
+            return conn.execute("UPDATE jobs SET delivered = 1 WHERE id = ? AND delivered = 0", (job_id,)).rowcount > 0
+
+    def stats(self, worker_timeout=None):
+        """상태별 작업 수와 최근 하트비트를 보낸 워커 수"""
+        worker_timeout = worker_timeout or self.lease_seconds * 2
+        with self.lock:
+            counts = dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE delivered = 0 GROUP BY status"
+            ).fetchall())
+            workers = self.conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat_at > ?", (time.time() - worker_timeout,)
+            ).fetchone()[0]
+        return {'queued': counts.get('queued', 0), 'running': counts.get('running', 0), 'workers': workers}
+
+    def purge(self, older_than=86400):
+        """전달이 끝난 오래된 작업 삭제"""
+        with self.transaction() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE delivered = 1 AND updated_at < ?", (time.time() - older_than,)
+            ).rowcount
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
 
-    def ensure_header(self):
-        if self.client and self.sheet.cell(1, 1).value != "Timestamp":
-            header = ["Timestamp", "User ID", "Username", "Request", "Response", "Elapsed Time (s)"]
-            self.sheet.insert_row(header, 1)
+class QueueBackend:
+    """작업 대기열에 스크래핑을 맡기고 별도 워커 프로세스의 결과를 기다리는 백엔드
 
-    def log_to_file(self, row):
+    브라우저 스크래핑을 다른 프로세스/호스트에서 실행할 뿐이므로 라우팅 정책에서는 browser 백엔드로 취급한다.
+    """
+    name = "browser"
+
+    def __init__(self, job_queue, timeout=180, poll_interval=0.5):
+        self.job_queue = job_queue
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.waiters = {}
+        self.on_orphan = None
+        self.task = None
+
+    async def generate(self, prompt, lang, region, on_progress=None, low_priority=False, user_id=None, target=None):
+        chat_id, message_id = target or (None, None)
+        payload = {'prompt': prompt, 'lang': lang, 'region': region, 'user_id': user_id}
+        # 결과가 아주 빨리 나와도 놓치지 않도록 대기자를 먼저 등록한 뒤 작업을 넣는다
+        job_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[job_id] = {'future': future, 'on_progress': on_progress, 'progress': None}
+        self.start()
         try:
-            log_dir = "logs"
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            with open(os.path.join(log_dir, "failed_sheet_logs.txt"), "a", encoding="utf-8") as f:
-                f.write(json.dumps(row) + "\n")
-        except Exception as file_e:
-            logger.error(f"파일 로그 기록 실패: {file_e}")
+            await asyncio.to_thread(self.job_queue.enqueue, payload, chat_id, message_id, self.timeout, job_id,
+                                    low_priority)
+            job = await asyncio.wait_for(future, self.timeout)
+            # 전달 권한을 얻을 때까지 대기자를 유지해야 dispatch()가 같은 결과를 on_orphan으로 보내지 않는다
+            claimed = await asyncio.to_thread(self.job_queue.claim_delivery, job_id)
+        finally:
+            self.waiters.pop(job_id, None)
 
-    def log(self, user_id, username, request, response, elapsed_time):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        row_data = [timestamp, str(user_id), username, request, response, f"{elapsed_time:.2f}"]
-        
-        if self.client:
+        if not claimed:
+            logger.info(f"작업 결과를 이미 다른 곳에서 전달했습니다. ({job_id})")
+            return None, None
+        if job['status'] != 'done':
+            logger.error(f"스크래핑 작업 실패 ({job_id}): {job['error']}")
+            return None, None
+        return job['result']['ref'], job['result']['data']
+
+    async def dispatch(self):
+        """기다리는 작업의 진행 상황과 결과를 반영하고, 대기자가 없는 결과는 on_orphan으로 전달"""
+        jobs = await asyncio.to_thread(self.job_queue.poll, list(self.waiters))
+        for job_id, job in jobs.items():
+            waiter = self.waiters.get(job_id)
+            if waiter is None or waiter['future'].done():
+                continue
+            if job['status'] in ('done', 'failed'):
+                waiter['future'].set_result(job)
+            elif job['progress'] and job['progress'] != waiter['progress'] and waiter['on_progress']:
+                waiter['progress'] = job['progress']
+                waiter['on_progress'](job['progress'])
+
+        if not self.on_orphan:
+            return
+        for job in await asyncio.to_thread(self.job_queue.undelivered):
+            if job['id'] in self.waiters:
+                continue
+            if await asyncio.to_thread(self.job_queue.claim_delivery, job['id']):
+                try:
+                    await self.on_orphan(job)
+                except Exception as e:
+                    logger.warning(f"작업 결과 전달 실패 ({job['id']}): {e}")
+
+    async def run(self):
+        while True:
             try:
-                self.sheet.append_row(row_data)
+                await self.dispatch()
             except Exception as e:
-                logger.error(f"Google Sheets 로깅 실패: {e}. 파일에 기록합니다.")
-                self.log_to_file(row_data)
-        else:
-            self.log_to_file(row_data)
+                logger.warning(f"작업 대기열 조회 실패: {e}")
+            await asyncio.sleep(self.poll_interval)
 
-class GeminiNewsScraper:
-    def __init__(self):
-        self.driver = None
-        self.wait = None
-        
-    def setup_driver(self):
-        """Chrome 드라이버 설정"""
-        chrome_options = Options()
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--headless")  # 백그라운드 실행
-        chrome_options.add_argument("--user-data-dir=/tmp/chrome_profile")
-        
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.wait = WebDriverWait(self.driver, 30)
-        
-    def access_gemini(self, lang='ko', region='KR'):
-        """Gemini 웹사이트 접속 (언어 및 지역 설정 포함)"""
-        try:
-            logger.info(f"Gemini 웹사이트에 접속 중... (언어: {lang}, 지역: {region})")
-            self.driver.get(f"https://gemini.google.com/?lang={lang}&region={region}")
-            time.sleep(5)
-            logger.info("페이지 로딩 완료")
-            
-        except Exception as e:
-            logger.error(f"웹사이트 접속 중 오류: {e}")
-            raise
-            
-    def find_textarea(self):
-        """입력창 찾기"""
-        textarea_selectors = [
-            "textarea",
-            "[contenteditable='true']",
-            "input[type='text']",
-            "[data-testid*='input']",
-            "[placeholder*='message']",
-            "[placeholder*='질문']",
-            ".input-area textarea",
-            "#prompt-textarea"
-        ]
-        
-        for selector in textarea_selectors:
+    def start(self):
+        """결과 수집 작업 시작 (이벤트 루프 안에서 호출)"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
             try:
-                elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                if elements:
-                    for element in elements:
-                        if element.is_displayed() and element.is_enabled():
-                            logger.info(f"입력창을 찾았습니다: {selector}")
-                            return element
-            except Exception:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.job_queue.close()
+
+class BackendRouter:
+    """명령어별 정책에 따라 백엔드를 고르고, 실패하면 다음 백엔드로 넘기는 라우터"""
+    POLICIES = {
+        'api_first': ['api', 'browser'],
+        'browser_first': ['browser', 'api'],
+        'api': ['api'],
+        'browser': ['browser'],
+    }
+
+    def __init__(self, backends, policy='browser', command_policies=None, breaker_options=None):
+        self.backends = {backend.name: backend for backend in backends}
+        self.policy = policy
+        self.command_policies = command_policies or {}
+        self.breakers = {name: CircuitBreaker(**(breaker_options or {})) for name in self.backends}
+        self.metrics = {name: {'requests': 0, 'errors': 0, 'total_latency': 0.0} for name in self.backends}
+
+    def order(self, command):
+        """명령어에 적용할 백엔드 순서 (설정되지 않은 백엔드는 제외)"""
+        policy = self.command_policies.get(command, self.policy)
+        names = [name for name in self.POLICIES.get(policy, [policy]) if name in self.backends]
+        return [self.backends[name] for name in names] or list(self.backends.values())[:1]
+
+    def record(self, backend, started, ok):
+        stats = self.metrics[backend.name]
+        stats['requests'] += 1
+        stats['total_latency'] += time.time() - started
+        if not ok:
+            stats['errors'] += 1
+        backend_request_count.inc(backend=backend.name, result='ok' if ok else 'error')
+
+    def summary(self):
+        """백엔드별 요청 수, 오류율, 평균 지연 시간"""
+        return {
+            name: {
+                'requests': m['requests'],
+                'error_rate': m['errors'] / m['requests'] if m['requests'] else 0.0,
+                'avg_latency': m['total_latency'] / m['requests'] if m['requests'] else 0.0,
+                'circuit': self.breakers[name].state,
+            }
+            for name, m in self.metrics.items()
+        }
+
+    async def run(self, command, call):
+        """call(backend)을 순서대로 시도하여 첫 번째 성공 결과 반환 (모두 실패하면 마지막 오류 전달)
+
+        차단기가 열린 백엔드는 건너뛰고, 모든 백엔드가 차단되어 있으면 CircuitOpenError를 바로 발생시킨다.
+        """
+        backends = self.order(command)
+        attempted = False
+        for i, backend in enumerate(backends):
+            is_last = i == len(backends) - 1
+            breaker = self.breakers[backend.name]
+            if not breaker.allow():
+                logger.warning(f"{backend.name} 백엔드 차단기가 열려 있어 건너뜁니다.")
                 continue
-                
-        return None
-        
-    def send_message(self, textarea):
-        """메시지 전송"""
-        try:
-            from selenium.webdriver.common.keys import Keys
-            textarea.send_keys(Keys.RETURN)
-            logger.info("Enter 키로 전송했습니다.")
-            return
-        except:
-            pass
-            
-        send_button_selectors = [
-            "button[aria-label*='Send']",
-            "button[aria-label*='전송']",
-            "[data-testid*='send']",
-            "button[type='submit']",
-            ".send-button",
-            "button:has(svg)"
-        ]
-        
-        for selector in send_button_selectors:
+            attempted = True
+            started = time.time()
             try:
-                buttons = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                for button in buttons:
-                    if button.is_displayed() and button.is_enabled():
-                        button.click()
-                        logger.info(f"전송 버튼을 클릭했습니다: {selector}")
-                        return
-            except Exception:
+                result = await call(backend)
+            except (asyncio.CancelledError, ScraperBusyError) as e:
+                # 취소나 대기열 초과는 백엔드 상태와 관계가 없으므로 차단기에 반영하지 않는다
+                breaker.release()
+                if isinstance(e, asyncio.CancelledError) or is_last:
+                    raise
+                logger.warning(f"{backend.name} 백엔드가 바빠 다음 백엔드로 전환합니다.")
                 continue
-                
-        # 마지막 시도
-        textarea.send_keys(Keys.RETURN)
-        
-    def get_response_text(self):
-        """응답 텍스트 추출"""
-        try:
-            body_text = self.driver.find_element(By.TAG_NAME, "body").text
-            lines = body_text.split('\n')
-            response_lines = []
-            
-            collecting = False
-            for line in lines:
-                if any(keyword in line for keyword in ['뉴스', 'News', '오늘', '주요']):
-                    collecting = True
-                    
-                if collecting and line.strip():
-                    response_lines.append(line.strip())
-                    
-            if response_lines:
-                response_text = '\n'.join(response_lines)
-                logger.info(f"응답 추출 완료 (길이: {len(response_text)} 문자)")
-                return response_text
-            else:
-                logger.warning("뉴스 관련 응답을 찾을 수 없어 전체 페이지 텍스트를 반환합니다.")
-                return body_text
-                
-        except Exception as e:
-            logger.error(f"응답 텍스트 추출 중 오류: {e}")
-            return "응답 추출 실패"
-            
-    def save_to_json(self, response_text, prompt="오늘의 주요 뉴스 알려줘", filename=None):
-        """응답을 JSON 파일로 저장"""
-        if filename == None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            prefix = "gemini_news" if "뉴스" in prompt else "gemini_response"
-            filename = f"{prefix}_{timestamp}.json"
-            
-        data = {
-            "timestamp": datetime.now().isoformat(),
-            "prompt": prompt,
-            "response": response_text,
-            "source": "Gemini AI"
-        }
-        
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            logger.info(f"결과가 {filename}에 저장되었습니다.")
-            return filename, data
-        except Exception as e:
-            logger.error(f"JSON 파일 저장 중 오류: {e}")
-            raise
-            
-    def run(self, custom_prompt="오늘의 주요 뉴스 알려줘", lang='ko', region='KR'):
-        """메인 실행 함수"""
-        try:
-            logger.info("=== Gemini 스크래퍼 시작 ===")
-            
-            self.setup_driver()
-            self.access_gemini(lang, region)
-            
-            logger.info(f"프롬프트 입력 중: {custom_prompt}")
-            textarea = self.find_textarea()
-            if not textarea:
-                logger.error("입력창을 찾을 수 없습니다.")
-                return None, None
-            
-            textarea.clear()
-            textarea.send_keys(custom_prompt)
-            self.send_message(textarea)
-            
-            logger.info("응답을 기다리는 중...")
-            time.sleep(30)
-            
-            response_text = self.get_response_text()
-            
-            if response_text:
-                filename, data = self.save_to_json(response_text, custom_prompt)
-                logger.info("=== 작업 완료 ===")
-                return filename, data
+            except Exception as e:
+                self.record(backend, started, False)
+                breaker.record(False)
+                if is_last:
+                    raise
+                logger.warning(f"{backend.name} 백엔드 실패, 다음 백엔드로 전환합니다: {e}")
+                continue
+            ok = bool(result and result[1])
+            self.record(backend, started, ok)
+            breaker.record(ok)
+            if ok or is_last:
+                return result
+            logger.warning(f"{backend.name} 백엔드가 응답을 가져오지 못해 다음 백엔드로 전환합니다.")
+        if not attempted:
+            raise CircuitOpenError("모든 백엔드의 차단기가 열려 있습니다.")
+        return None, None
+
+    async def close(self):
+        for backend in self.backends.values():
+            await backend.close()
+
+class ScrapeStream:
+    """워커 스레드의 스크래퍼가 전달하는 중간 응답을 비동기 반복자로 제공하는 스트림"""
+    END = object()
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.finished = False
+        self.done = asyncio.Event()
+
+    def push(self, text):
+        """스크래퍼 스레드에서 호출 (스레드 안전)"""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+
+    def finish(self):
+        """이벤트 루프에서 호출하여 스트림 종료"""
+        self.finished = True
+        self.done.set()
+        self.queue.put_nowait(self.END)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        # 밀린 중간 응답은 건너뛰고 가장 최신 텍스트만 전달한다
+        while item is not self.END and not self.queue.empty():
+            next_item = self.queue.get_nowait()
+            if next_item is self.END:
+                self.queue.put_nowait(self.END)
+                break
+            item = next_item
+        if item is self.END:
+            raise StopAsyncIteration
+        return item
+
+class MessageRenderer:
+    """응답을 텔레그램 Markdown에 안전한 여러 메시지로 나누는 렌더러
+
+    본문의 특수 문자는 포맷팅할 때 한 번만 이스케이프하고, 강조 표시는 한 줄 안에서만 사용하므로
+    블록(빈 줄)이나 줄 경계에서 나누면 각 페이지가 그대로 유효한 Markdown이 된다.
+    """
+    SPECIAL_CHARS = re.compile(r'([_*`\[])')
+    MARKUP = re.compile(r'\\([_*`\[])|\*')
+    BOLD_SPAN = re.compile(r'\*\*(.+?)\*\*')
+
+    def __init__(self, max_length=3900):
+        self.max_length = max_length
+
+    def escape(self, text):
+        """엔티티 밖에서 쓰이는 특수 문자 이스케이프"""
+        return self.SPECIAL_CHARS.sub(r'\\\1', text)
+
+    def bold(self, text):
+        """굵은 글씨 (엔티티 안에서는 이스케이프가 적용되지 않으므로 '*'만 제거)"""
+        return f"*{text.replace('*', '')}*"
+
+    def inline(self, text):
+        """응답 한 줄 변환 (**강조**는 굵은 글씨로 유지하고 나머지 특수 문자는 이스케이프)"""
+        parts = self.BOLD_SPAN.split(text)
+        return ''.join(self.bold(part) if i % 2 else self.escape(part) for i, part in enumerate(parts))
+
+    def to_plain(self, text):
+        """Markdown 전송이 거부되었을 때 사용할 일반 텍스트 (이스케이프와 강조 기호 제거)"""
+        return self.MARKUP.sub(lambda m: m.group(1) or '', text)
+
+    def split_line(self, line):
+        """한도를 넘는 한 줄을 공백 기준으로 나눔 (이스케이프 문자 중간에서는 자르지 않음)"""
+        pieces = []
+        while len(line) > self.max_length:
+            cut = line.rfind(' ', 0, self.max_length)
+            if cut <= 0:
+                cut = self.max_length
+            while cut > 1 and line[cut - 1] == '\\':
+                cut -= 1
+            pieces.append(line[:cut].rstrip())
+            line = line[cut:].lstrip()
+        pieces.append(line)
+        return pieces
+
+    def split(self, markdown):
+        """블록 경계를 우선으로 메시지 길이 한도 안의 페이지 목록으로 나눔 (한도를 넘는 블록은 줄 단위로 채움)"""
+        pages = []
+        current = ""
+        for block in markdown.split('\n\n'):
+            block = block.strip('\n')
+            if not block:
+                continue
+            if len(block) <= self.max_length:
+                pieces = [block]
             else:
-                logger.error("응답을 받지 못했습니다.")
-                return None, None
-            
-        except Exception as e:
-            logger.error(f"오류 발생: {e}")
-            return None, None
-        finally:
-            if self.driver:
-                self.driver.quit()
+                pieces = [part for line in block.split('\n') for part in self.split_line(line)]
+            for i, piece in enumerate(pieces):
+                separator = '\n\n' if i == 0 else '\n'
+                candidate = f"{current}{separator}{piece}" if current else piece
+                if len(candidate) <= self.max_length:
+                    current = candidate
+                else:
+                    pages.append(current)
+                    current = piece
+        if current:
+            pages.append(current)
+        return pages or [markdown]
+
+class PagedResponseStore:
+    """여러 페이지로 나눈 긴 응답을 보관 ("더 보기" 버튼으로 다시 스크래핑하지 않고 전송, TTL/LRU 제한)"""
+    def __init__(self, ttl=86400, max_entries=500):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def put(self, pages):
+        """페이지 목록 저장 후 버튼에 넣을 짧은 ID 반환"""
+        page_id = uuid.uuid4().hex[:12]
+        self.entries[page_id] = (time.time() + self.ttl, pages)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return page_id
+
+    def get(self, page_id):
+        """저장된 페이지 목록 (없거나 만료되면 None)"""
+        entry = self.entries.get(page_id)
+        if entry is None:
+            return None
+        expires_at, pages = entry
+        if expires_at < time.time():
+            del self.entries[page_id]
+            return None
+        self.entries.move_to_end(page_id)
+        return pages
 
 class TelegramNewsBot:
-    def __init__(self, token, sheet_logger):
+    def __init__(self, token, sheet_logger, executor=None, driver_pool=None, warmup=False, profile_manager=None,
+                 detector=None, streaming=True, stream_edit_interval=1.5, news_cache=None,
+                 prefetch_interval=0, prefetch_times=(), store=None, settings_store=None, extractor=None,
+                 resolver=None, api_backend=None, backend_policy='browser', command_policies=None,
+                 admission=None, metrics_port=0, trace_log=None, renderer=None, page_store=None, page_batch=3,
+                 bot_api_pool_size=256, bot_api_pool_timeout=10.0, queue_backend=None, msg_index=None,
+                 scrape_max_attempts=2, scrape_retry_delay=1.0, breaker_options=None, stale_answers=256):
         self.token = token
         self.application = None
         self.sheet_logger = sheet_logger
+        self.executor = executor or ScrapeExecutor()
+        self.driver_pool = driver_pool
+        self.warmup = warmup
+        self.profile_manager = profile_manager
+        self.detector = detector or ResponseCompletionDetector()
+        self.extractor = extractor or ResponseExtractor(self.detector.response_selectors)
+        self.resolver = resolver or SelectorResolver()
+        self.streaming = streaming
+        self.stream_edit_interval = stream_edit_interval
+        self.news_cache = news_cache or ResponseCache()
+        self.msg_index = msg_index or PromptSimilarityIndex()
+        self.recent_news_pairs = {}
+        self.store = store
+        self.settings_store = settings_store or UserSettingsStore()
+        self.prefetcher = NewsPrefetcher(self, prefetch_interval, prefetch_times)
+        # 작업 대기열을 사용하면 스크래핑은 별도 워커 프로세스(scraper_worker.py)가 맡는다
+        self.queue_backend = queue_backend
+        backends = [queue_backend or BrowserBackend(self.executor, self.create_scraper,
+                                                    scrape_max_attempts, scrape_retry_delay)]
+        if api_backend:
+            backends.append(api_backend)
+        self.router = BackendRouter(backends, backend_policy, command_policies, breaker_options)
+        # 모든 백엔드가 실패할 때 대신 보여줄 질문별 마지막 성공 응답
+        self.last_answers = OrderedDict()
+        self.max_last_answers = stale_answers
+        self.admission = admission or AdmissionController(self.executor.max_workers, self.executor.max_queue)
+        self.renderer = renderer or MessageRenderer()
+        self.page_store = page_store or PagedResponseStore()
+        self.page_batch = max(1, page_batch)
+        self.bot_api_pool_size = bot_api_pool_size
+        self.bot_api_pool_timeout = bot_api_pool_timeout
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        self.trace_log = trace_log
+        self.register_gauges()
         
+    def register_gauges(self):
+        """대기열 길이, 드라이버 풀 사용률, Chrome 메모리 사용량 게이지 등록"""
+        metrics.gauge("gemtelebot_scraper_pending", "스크래퍼 워커에서 실행 중이거나 대기 중인 작업 수",
+                      lambda: self.executor.pending)
+        metrics.gauge("gemtelebot_admission_running", "처리 중인 요청 수", lambda: self.admission.running)
+        metrics.gauge("gemtelebot_admission_waiting", "처리 대기 중인 요청 수", self.admission.waiting_count)
+        if self.driver_pool:
+            self.driver_pool.register_gauges()
+        if self.queue_backend:
+            job_queue = self.queue_backend.job_queue
+            metrics.gauge("gemtelebot_job_queue_queued", "워커를 기다리는 스크래핑 작업 수",
+                          lambda: job_queue.stats()['queued'])
+            metrics.gauge("gemtelebot_job_queue_running", "워커가 실행 중인 스크래핑 작업 수",
+                          lambda: job_queue.stats()['running'])
+            metrics.gauge("gemtelebot_job_queue_workers", "최근 하트비트를 보낸 스크래퍼 워커 수",
+                          lambda: job_queue.stats()['workers'])
+        for name, breaker in self.router.breakers.items():
+            metrics.gauge(f"gemtelebot_circuit_open_{name}", f"{name} 백엔드 차단기 상태 (0: 닫힘, 1: 열림, 0.5: 시험 중)",
+                          lambda b=breaker: {'closed': 0, 'open': 1, 'half_open': 0.5}[b.state])
+        metrics.gauge("gemtelebot_chrome_rss_bytes", "chromedriver/Chrome 프로세스 RSS 합계(바이트)", chrome_rss_bytes)
+
+    async def record_request(self, trace, status, elapsed_time):
+        """요청 결과를 지표에 반영하고, 추적 로그가 설정되어 있으면 단계별 시간을 기록"""
+        request_count.inc(command=trace['command'], status=status)
+        request_seconds.observe(elapsed_time, command=trace['command'])
+        if self.trace_log:
+            trace.update(timestamp=datetime.now().isoformat(), status=status, elapsed=round(elapsed_time, 3))
+            await asyncio.to_thread(self.trace_log.write, trace)
+
+    def create_scraper(self, user_id=None):
+        """공유 자원(드라이버 풀, 프로필, 완료 감지기, 저장소, 추출기, 선택자 해석기)을 사용하는 스크래퍼 생성"""
+        return GeminiNewsScraper(self.driver_pool, self.profile_manager, self.detector, self.store, user_id,
+                                 self.extractor, self.resolver)
+
+    async def scrape(self, prompt, lang, region, loading_msg=None, low_priority=False, user_id=None, command='msg'):
+        """라우팅 정책에 따라 백엔드에서 응답 생성 (스트리밍 모드에서는 생성 중인 응답을 로딩 메시지에 반영)"""
+        # 작업 대기열 백엔드는 결과를 기다리던 요청이 사라져도 이 메시지로 결과를 보낸다
+        target = (loading_msg.chat_id, loading_msg.message_id) if loading_msg else None
+
+        async def call(backend):
+            if not (self.streaming and loading_msg):
+                return await backend.generate(prompt, lang, region, low_priority=low_priority, user_id=user_id,
+                                              target=target)
+
+            stream = ScrapeStream(asyncio.get_running_loop())
+            task = asyncio.ensure_future(
+                backend.generate(prompt, lang, region, stream.push, low_priority=low_priority, user_id=user_id,
+                                 target=target)
+            )
+            task.add_done_callback(lambda _: stream.finish())
+            try:
+                await self.stream_to_message(stream, loading_msg)
+            finally:
+                if not task.done():
+                    task.cancel()
+            return await task
+
+        try:
+            ref, data = await self.router.run(command, call)
+        except CircuitOpenError as e:
+            logger.warning(f"요청을 보내지 않았습니다: {e}")
+            return None, None
+        if data:
+            self.remember_answer(prompt, lang, region, data)
+        return ref, data
+
+    @staticmethod
+    def answer_key(prompt, lang, region):
+        return f"{lang}|{region}|{' '.join(prompt.split()).lower()}"
+
+    def remember_answer(self, prompt, lang, region, data):
+        """질문별 마지막 성공 응답 저장 (오래된 항목부터 제거)"""
+        key = self.answer_key(prompt, lang, region)
+        self.last_answers[key] = data
+        self.last_answers.move_to_end(key)
+        while len(self.last_answers) > self.max_last_answers:
+            self.last_answers.popitem(last=False)
+
+    def stale_answer(self, prompt, lang, region):
+        """Gemini에 연결할 수 없을 때 보여줄 같은 질문의 이전 응답"""
+        data = self.last_answers.get(self.answer_key(prompt, lang, region))
+        return {**data, 'stale': True} if data else None
+
+    async def stream_to_message(self, stream, message):
+        """중간 응답을 편집 간격에 맞춰 병합하여 메시지에 반영 (텔레그램 편집 한도 준수)"""
+        last_edit = 0
+        last_text = None
+        async for text in stream:
+            wait = self.stream_edit_interval - (time.time() - last_edit)
+            if wait > 0:
+                try:
+                    # 편집 간격을 기다리는 중에 생성이 끝나면 바로 최종 응답으로 넘어간다
+                    await asyncio.wait_for(stream.done.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                if stream.finished:
+                    break
+            preview = text if len(text) <= 3900 else text[:3900] + "\n…"
+            if preview == last_text:
+                continue
+            try:
+                await message.edit_text(preview + " ▌")
+                last_text = preview
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else retry_after)
+            except Exception as e:
+                logger.debug(f"중간 응답 편집 실패: {e}")
+            last_edit = time.time()
+
+    async def send_markdown(self, send, text, reply_markup=None):
+        """Markdown으로 전송 (이스케이프된 페이지라 보통 한 번에 성공하며, 거부된 페이지만 일반 텍스트로 전송)"""
+        try:
+            await send(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+            return text
+        except BadRequest as markdown_error:
+            logger.warning(f"Markdown 파싱 오류, 일반 텍스트로 전송: {markdown_error}")
+            plain_text = self.renderer.to_plain(text)
+            await send(plain_text, reply_markup=reply_markup)
+            return plain_text
+
+    def more_button(self, page_id, index, total):
+        """다음 페이지를 요청하는 "더 보기" 버튼"""
+        return InlineKeyboardMarkup([[
+            InlineKeyboardButton(f"더 보기 ({index + 1}/{total})", callback_data=f"more:{page_id}:{index}")
+        ]])
+
+    async def send_pages(self, pages, first_send, reply, start=0, page_id=None):
+        """pages[start:]에서 최대 page_batch개를 순서대로 전송 (남은 페이지가 있으면 마지막 메시지에 버튼 추가)"""
+        end = min(len(pages), start + self.page_batch)
+        if end < len(pages) and page_id is None:
+            page_id = self.page_store.put(pages)
+        sent = []
+        for i in range(start, end):
+            markup = self.more_button(page_id, end, len(pages)) if i == end - 1 and end < len(pages) else None
+            sent.append(await self.send_markdown(first_send if i == start else reply, pages[i], markup))
+        return '\n\n'.join(sent)
+
+    async def send_response(self, update, loading_msg, markdown_response):
+        """최종 응답을 페이지로 나눠 순서대로 전송한 뒤 실제 전송한 텍스트 반환"""
+        pages = self.renderer.split(markdown_response)
+        if self.streaming:
+            return await self.send_pages(pages, loading_msg.edit_text, update.message.reply_text)
+
+        # 로딩 메시지 삭제는 첫 페이지 전송과 동시에 진행한다
+        delete_task = asyncio.ensure_future(loading_msg.delete())
+        try:
+            return await self.send_pages(pages, update.message.reply_text, update.message.reply_text)
+        finally:
+            await delete_task
+
+    async def deliver_job_result(self, job):
+        """기다리던 요청이 없어진 작업 결과를 원래 대화의 로딩 메시지로 전송 (봇 재시작이나 대기 시간 초과 후 완료된 경우)"""
+        if job['status'] != 'done' or not job['chat_id']:
+            return
+        data = job['result']['data']
+        pages = self.renderer.split(self.format_response_to_markdown(data, data.get('lang', 'ko')))
+        bot = self.application.bot
+        edit = functools.partial(bot.edit_message_text, chat_id=job['chat_id'], message_id=job['message_id'])
+        await self.send_pages(pages, edit, functools.partial(bot.send_message, job['chat_id']))
+        logger.info(f"지연된 작업 결과를 전달했습니다. (작업: {job['id']}, 대화: {job['chat_id']})")
+
+    async def more_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """"더 보기" 버튼 처리 (보관된 다음 페이지 전송)"""
+        query = update.callback_query
+        try:
+            _, page_id, index = query.data.split(':')
+            index = int(index)
+        except ValueError:
+            await query.answer()
+            return
+
+        pages = self.page_store.get(page_id)
+        if pages is None or index >= len(pages):
+            await query.answer("보관 기간이 지난 답변입니다. 다시 질문해주세요.", show_alert=True)
+            return
+        await query.answer()
+        try:
+            await query.edit_message_reply_markup(None)
+        except BadRequest as e:
+            logger.debug(f"더 보기 버튼 제거 실패: {e}")
+        await self.send_pages(pages, query.message.reply_text, query.message.reply_text, index, page_id)
+
+    def news_prompt(self, region):
+        """지역별 뉴스 요청 프롬프트"""
+        return f"오늘의 {region} 주요 뉴스 알려줘"
+
     def get_user_settings(self, user_id):
         """사용자 설정 가져오기 (없으면 기본값)"""
-        return user_settings.get(user_id, {'lang': 'ko', 'region': 'KR'})
+        return self.settings_store.get(user_id)
+
+    def get_queue_notice(self, ticket=None):
+        """대기열이 있을 때 로딩 메시지에 붙일 대기 순번 안내"""
+        position = ticket.position if ticket and ticket.position else self.executor.queue_position()
+        return f"\n⏳ 현재 #{position}번째 대기 중입니다." if position > 0 else ""
+
+    def take_ticket(self, user_id, prompt):
+        """요청 접수 (거절되면 AdmissionRejected)"""
+        if self.application and not self.application.running:
+            # 종료 중에는 진행 중인 요청만 마무리하고, 아직 남아 있던 업데이트는 새로 스크래핑하지 않는다
+            raise AdmissionRejected('restarting', "🔄 봇이 재시작 중입니다. 잠시 후 다시 시도해주세요.")
+        return self.admission.admit(user_id, prompt)
+
+    async def admit(self, update, user_id, prompt):
+        """요청 접수 (거절되면 바로 안내 메시지를 보내고 None 반환)"""
+        try:
+            return self.take_ticket(user_id, prompt)
+        except AdmissionRejected as e:
+            logger.info(f"요청 거절 ({e.reason}): 사용자 {user_id}")
+            await update.message.reply_text(e.message)
+            return None
 
     def get_disclaimer(self, lang='ko'):
         """언어 설정에 맞는 주의 문구 반환"""
@@ -281,8 +3014,11 @@ class TelegramNewsBot:
         icon = "📰" if is_news else "🤖"
         title = "오늘의 주요 뉴스" if is_news else "Gemini AI 응답"
         
-        markdown = f"{icon} **{title}**\n"
-        markdown += f"❓ *질문: {prompt}*\n"
+        markdown = ""
+        if response_data.get('stale'):
+            markdown += self.renderer.escape("⚠️ 지금은 Gemini에 연결할 수 없어 이전에 받은 답변을 보여드립니다.") + "\n\n"
+        markdown += f"{icon} {self.renderer.bold(title)}\n"
+        markdown += f"❓ {self.renderer.bold(f'질문: {prompt}')}\n"
         markdown += f"🕐 {datetime.fromisoformat(timestamp).strftime('%Y-%m-%d %H:%M')}\n\n"
         
         lines = response.split('\n')
@@ -294,21 +3030,18 @@ class TelegramNewsBot:
                 continue
             if any(keyword in line for keyword in ['정치', '경제', '사회', '국제', '재난', '안전', 'Politics', 'Economy', 'Social']):
                 if ':' in line and len(line) < 50:
-                    formatted_lines.append(f"\n**{line}**")
+                    formatted_lines.append(f"\n{self.renderer.bold(line)}")
                 else:
-                    formatted_lines.append(line)
+                    formatted_lines.append(self.renderer.inline(line))
             elif line in ['오늘의 주요 뉴스 알려줘', 'Gemini는', '새 창에서 열기', 'Open in new window']:
                 continue
             else:
-                formatted_lines.append(line)
+                formatted_lines.append(self.renderer.inline(line))
         
         markdown += '\n'.join(formatted_lines)
         
         # 주의 문구 추가
         markdown += self.get_disclaimer(lang)
-
-        if len(markdown) > 4000:
-            markdown = markdown[:3950] + "\n\n... (내용이 길어 일부 생략됨)"
             
         return markdown
         
@@ -329,6 +3062,7 @@ class TelegramNewsBot:
 **사용 방법:**
 • `/news` - 오늘의 뉴스 가져오기
 • `/msg [질문]` - 원하는 질문을 Gemini에게 물어보기
+• `/msg --fresh [질문]` - 캐시된 답변 대신 새로 물어보기
 • `/setting [항목] [값]` - 언어/지역 설정 변경
 • `/start` - 도움말 보기
 
@@ -354,15 +3088,12 @@ class TelegramNewsBot:
             return
 
         setting_type, value = args[0].lower(), args[1].upper()
-        
-        if user_id not in user_settings:
-            user_settings[user_id] = {'lang': 'ko', 'region': 'KR'}
             
         if setting_type == 'lang':
-            user_settings[user_id]['lang'] = value.lower()
+            self.settings_store.update(user_id, lang=value.lower())
             await update.message.reply_text(f"✅ 언어가 `{value.lower()}`로 설정되었습니다.")
         elif setting_type == 'region':
-            user_settings[user_id]['region'] = value
+            self.settings_store.update(user_id, region=value)
             await update.message.reply_text(f"✅ 지역이 `{value}`로 설정되었습니다.")
         else:
             await update.message.reply_text("❌ 잘못된 설정 항목입니다. `lang` 또는 `region`을 사용하세요.")
@@ -374,41 +3105,75 @@ class TelegramNewsBot:
         user_id = user.id
         settings = self.get_user_settings(user_id)
         lang, region = settings['lang'], settings['region']
-        prompt = f"오늘의 {region} 주요 뉴스 알려줘"
+        prompt = self.news_prompt(region)
+        self.recent_news_pairs[(lang, region)] = time.time()
 
-        loading_msg = await update.message.reply_text(
+        response_text = ""
+        trace = {'command': 'news', 'user_id': user_id, 'lang': lang, 'region': region}
+        status = 'error'
+        ticket = None
+        loading_text = (
             f"📰 뉴스를 가져오는 중입니다... (언어: {lang}, 지역: {region})\n"
             "⏰ 약 30-60초 소요됩니다. 잠시만 기다려주세요!"
         )
-        
-        response_text = ""
+        loading_msg = await update.message.reply_text(loading_text)
         try:
-            scraper = GeminiNewsScraper()
-            filename, news_data = scraper.run(prompt, lang, region)
+            async def fetch_news():
+                # 캐시에 없고 진행 중인 요청도 없어 실제로 스크래핑하는 요청만 접수 한도를 사용한다
+                nonlocal ticket
+                ticket = self.take_ticket(user_id, prompt)
+                if ticket.position:
+                    await loading_msg.edit_text(f"{loading_text}{self.get_queue_notice(ticket)}")
+                await ticket.wait()
+                _, data = await self.scrape(prompt, lang, region, loading_msg, user_id=user_id, command='news')
+                return data
+
+            cache_key = ResponseCache.make_key(prompt, lang, region)
+            news_data, cached = await self.news_cache.get_or_fetch(cache_key, fetch_news)
+            news_cache_lookups.inc(result='hit' if cached else 'miss')
+            trace['cached'] = cached
+            if not news_data:
+                # 이전 응답은 뉴스 캐시에 넣지 않아 다음 요청은 다시 새 뉴스를 시도한다
+                news_data = self.stale_answer(prompt, lang, region)
             
             if news_data:
-                markdown_response = self.format_response_to_markdown(news_data, lang)
-                response_text = markdown_response
-                await loading_msg.delete()
-                try:
-                    await update.message.reply_text(markdown_response, parse_mode=ParseMode.MARKDOWN)
-                except Exception as markdown_error:
-                    logger.warning(f"Markdown 파싱 오류, 일반 텍스트로 전송: {markdown_error}")
-                    plain_text = markdown_response.replace("**", "").replace("*", "").replace("_", "")
-                    response_text = plain_text
-                    await update.message.reply_text(plain_text)
-                logger.info(f"뉴스 전송 완료. 파일: {filename}")
+                if not cached and not news_data.get('stale'):
+                    trace.update(news_data.get('timings') or {})
+                with metrics.timer('format', trace):
+                    markdown_response = self.format_response_to_markdown(news_data, lang)
+                with metrics.timer('telegram_send', trace):
+                    response_text = await self.send_response(update, loading_msg, markdown_response)
+                status = 'stale' if news_data.get('stale') else 'ok'
+                logger.info(f"뉴스 전송 완료. (캐시 사용: {cached})")
             else:
+                status = 'failed'
                 response_text = "❌ 뉴스를 가져오는데 실패했습니다."
                 await loading_msg.edit_text(response_text)
                 
+        except AdmissionRejected as e:
+            # 같은 뉴스를 기다리던 요청도 먼저 온 요청이 거절되면 같은 안내를 받는다
+            logger.info(f"요청 거절 ({e.reason}): 사용자 {user_id}")
+            status = 'rejected'
+            response_text = e.message
+            await loading_msg.edit_text(response_text)
+        except ScraperBusyError as e:
+            status = 'busy'
+            response_text = f"⏳ 요청이 많아 처리할 수 없습니다. 현재 #{e.position}번째 대기 중입니다. 잠시 후 다시 시도해주세요."
+            await loading_msg.edit_text(response_text)
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            response_text = "⌛ 응답 대기 시간이 초과되었습니다. 다시 시도해주세요."
+            await loading_msg.edit_text(response_text)
         except Exception as e:
             logger.error(f"뉴스 명령어 처리 중 오류: {e}")
             response_text = "❌ 오류가 발생했습니다."
             await loading_msg.edit_text(response_text)
         finally:
+            if ticket:
+                self.admission.release(ticket)
             elapsed_time = time.time() - start_time
             self.sheet_logger.log(user_id, user.username, prompt, response_text, elapsed_time)
+            await self.record_request(trace, status, elapsed_time)
             
     async def msg_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """사용자 정의 메시지 명령어 처리"""
@@ -418,50 +3183,99 @@ class TelegramNewsBot:
         settings = self.get_user_settings(user_id)
         lang, region = settings['lang'], settings['region']
         
-        user_prompt = ' '.join(context.args)
+        force_fresh = '--fresh' in context.args
+        user_prompt = ' '.join(arg for arg in context.args if arg != '--fresh')
         if not user_prompt.strip():
             await update.message.reply_text(
                 "❓ **사용법:** `/msg [질문]`\n"
-                "예시: `/msg 파이썬으로 웹 크롤링하는 방법 알려줘`",
+                "예시: `/msg 파이썬으로 웹 크롤링하는 방법 알려줘`\n"
+                "캐시된 답변 대신 새 답변을 받으려면: `/msg --fresh [질문]`",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
+
+        if force_fresh:
+            msg_cache_lookups.inc(result='skip')
+        elif await self.answer_from_index(update, user, user_prompt, lang, region, start_time):
+            return
         
-        loading_msg = await update.message.reply_text(
-            f"🤖 질문을 처리하는 중입니다...\n❓ *{user_prompt}*\n"
-            f"(언어: {lang}, 지역: {region})\n"
-            "⏰ 약 30-60초 소요됩니다."
-        )
-        
+        ticket = await self.admit(update, user_id, user_prompt)
+        if ticket is None:
+            return
+
         response_text = ""
+        trace = {'command': 'msg', 'user_id': user_id, 'lang': lang, 'region': region}
+        status = 'error'
+        try:
+            loading_msg = await update.message.reply_text(
+                f"🤖 질문을 처리하는 중입니다...\n❓ *{user_prompt}*\n"
+                f"(언어: {lang}, 지역: {region})\n"
+                "⏰ 약 30-60초 소요됩니다."
+                f"{self.get_queue_notice(ticket)}"
+            )
+        except Exception:
+            self.admission.release(ticket)
+            raise
         try:
-            scraper = GeminiNewsScraper()
-            filename, response_data = scraper.run(user_prompt, lang, region)
+            await ticket.wait()
+
+            filename, response_data = await self.scrape(user_prompt, lang, region, loading_msg, user_id=user_id)
+            if response_data:
+                self.msg_index.add(user_prompt, lang, region, response_data)
+                trace.update(response_data.get('timings') or {})
+            else:
+                response_data = self.stale_answer(user_prompt, lang, region)
             
             if response_data:
-                markdown_response = self.format_response_to_markdown(response_data, lang)
-                response_text = markdown_response
-                await loading_msg.delete()
-                try:
-                    await update.message.reply_text(markdown_response, parse_mode=ParseMode.MARKDOWN)
-                except Exception as markdown_error:
-                    logger.warning(f"Markdown 파싱 오류, 일반 텍스트로 전송: {markdown_error}")
-                    plain_text = markdown_response.replace("**", "").replace("*", "").replace("_", "")
-                    response_text = plain_text
-                    await update.message.reply_text(plain_text)
+                with metrics.timer('format', trace):
+                    markdown_response = self.format_response_to_markdown(response_data, lang)
+                with metrics.timer('telegram_send', trace):
+                    response_text = await self.send_response(update, loading_msg, markdown_response)
+                status = 'stale' if response_data.get('stale') else 'ok'
                 logger.info(f"사용자 질문 응답 완료. 파일: {filename}")
             else:
+                status = 'failed'
                 response_text = "❌ 응답을 가져오는데 실패했습니다."
                 await loading_msg.edit_text(response_text)
                 
+        except ScraperBusyError as e:
+            status = 'busy'
+            response_text = f"⏳ 요청이 많아 처리할 수 없습니다. 현재 #{e.position}번째 대기 중입니다. 잠시 후 다시 시도해주세요."
+            await loading_msg.edit_text(response_text)
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            response_text = "⌛ 응답 대기 시간이 초과되었습니다. 다시 시도해주세요."
+            await loading_msg.edit_text(response_text)
         except Exception as e:
             logger.error(f"사용자 질문 처리 중 오류: {e}")
             response_text = "❌ 오류가 발생했습니다."
             await loading_msg.edit_text(response_text)
         finally:
+            self.admission.release(ticket)
             elapsed_time = time.time() - start_time
             self.sheet_logger.log(user_id, user.username, user_prompt, response_text, elapsed_time)
+            await self.record_request(trace, status, elapsed_time)
             
+    async def answer_from_index(self, update, user, prompt, lang, region, start_time):
+        """최근 유사 질문의 답변이 있으면 스크래핑 없이 바로 전송 (전송했으면 True)"""
+        match = self.msg_index.lookup(prompt, lang, region)
+        msg_cache_lookups.inc(result='hit' if match else 'miss')
+        if not match:
+            return False
+        response_data, similarity = match
+        trace = {'command': 'msg', 'user_id': user.id, 'lang': lang, 'region': region,
+                 'cached': True, 'similarity': round(similarity, 3)}
+        with metrics.timer('format', trace):
+            notice = self.renderer.escape("♻️ 캐시된 답변 (새 답변: /msg --fresh [질문])")
+            pages = self.renderer.split(f"{notice}\n{self.format_response_to_markdown(response_data, lang)}")
+        with metrics.timer('telegram_send', trace):
+            response_text = await self.send_pages(pages, update.message.reply_text, update.message.reply_text)
+        logger.info(f"유사 질문 캐시로 응답했습니다. (유사도: {similarity:.2f})")
+        elapsed_time = time.time() - start_time
+        self.sheet_logger.log(user.id, user.username, prompt, response_text, elapsed_time)
+        await self.record_request(trace, 'cached', elapsed_time)
+        return True
+
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """일반 메시지 처리"""
         message_text = update.message.text.lower()
@@ -471,20 +3285,76 @@ class TelegramNewsBot:
         else:
             await self.start_command(update, context)
             
-    def run_bot(self):
-        """봇 실행"""
-        logger.info("텔레그램 봇을 시작합니다...")
-        
-        self.application = Application.builder().token(self.token).build()
+    async def post_init(self, application):
+        """이벤트 루프 시작 후 백그라운드 작업 실행"""
+        self.settings_store.start()
+        self.sheet_logger.start()
+        self.prefetcher.start()
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(metrics, self.metrics_port).start()
+        if self.queue_backend:
+            self.queue_backend.on_orphan = self.deliver_job_result
+            self.queue_backend.start()
+
+    async def post_shutdown(self, application):
+        """종료 시 백그라운드 작업 정리 (남은 로그 기록 포함)"""
+        await self.prefetcher.stop()
+        await self.sheet_logger.close()
+        await self.settings_store.close()
+        await self.router.close()
+        if self.store:
+            self.store.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+
+    def build_application(self, base_url=None):
+        """핸들러가 등록된 Application 생성 (base_url로 가짜 Bot API 서버 지정 가능)"""
+        # 처리 중/대기 중인 요청이 모두 핸들러를 점유해도 거절 안내나 /start 같은 짧은 요청은 바로 처리되도록 여유를 둔다
+        concurrency = self.admission.capacity + self.admission.max_waiting + 8
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(concurrency)
+            .connection_pool_size(self.bot_api_pool_size)
+            .pool_timeout(self.bot_api_pool_timeout)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+        )
+        if base_url:
+            builder = builder.base_url(base_url)
+        self.application = builder.build()
         
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("setting", self.setting_command))
         self.application.add_handler(CommandHandler("news", self.news_command))
         self.application.add_handler(CommandHandler("msg", self.msg_command))
+        self.application.add_handler(CallbackQueryHandler(self.more_callback, pattern=r"^more:"))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        return self.application
+
+    def run_bot(self, webhook=None):
+        """봇 실행 (webhook 설정이 있으면 웹훅 서버로, 없으면 롱 폴링으로 업데이트 수신)
+
+        종료 신호를 받으면 새 업데이트 수신을 멈추고, 처리 중인 요청이 끝난 뒤 자원을 정리한다.
+        """
+        logger.info("텔레그램 봇을 시작합니다...")
+        
+        self.build_application()
+        
+        if self.driver_pool and self.warmup:
+            threading.Thread(target=self.driver_pool.warmup, daemon=True).start()
         
         logger.info("봇이 시작되었습니다. Ctrl+C로 종료할 수 있습니다.")
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        try:
+            if webhook:
+                logger.info(f"웹훅 모드로 실행합니다: {webhook['listen']}:{webhook['port']}/{webhook['url_path']}")
+                self.application.run_webhook(allowed_updates=Update.ALL_TYPES, **webhook)
+            else:
+                self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        finally:
+            self.executor.shutdown()
+            if self.driver_pool:
+                self.driver_pool.close()
 
 def main():
     import os
@@ -493,17 +3363,151 @@ def main():
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     GOOGLE_CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE', 'google_credentials.json')
     GOOGLE_SHEET_NAME = os.getenv('GOOGLE_SHEET_NAME', 'Gemini Bot Logs')
+    LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '20'))
+    LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '5'))
+    SCRAPER_WORKERS = int(os.getenv('SCRAPER_WORKERS', '2'))
+    SCRAPER_MAX_QUEUE = int(os.getenv('SCRAPER_MAX_QUEUE', '10'))
+    SCRAPER_TIMEOUT = float(os.getenv('SCRAPER_TIMEOUT', '180'))
+    DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE', str(SCRAPER_WORKERS)))
+    DRIVER_MAX_USES = int(os.getenv('DRIVER_MAX_USES', '20'))
+    DRIVER_MAX_IDLE = float(os.getenv('DRIVER_MAX_IDLE', '600'))
+    DRIVER_MAX_HEAP_MB = int(os.getenv('DRIVER_MAX_HEAP_MB', '512'))
+    DRIVER_WARMUP = os.getenv('DRIVER_WARMUP', 'true').lower() == 'true'
+    CHROME_PROFILE_TEMPLATE = os.getenv('CHROME_PROFILE_TEMPLATE', '/tmp/chrome_profile')
+    CHROME_PROFILE_DIR = os.getenv('CHROME_PROFILE_DIR', '/tmp/gemtelebot_profiles')
+    CHROME_PROFILE_MAX_DISK_MB = int(os.getenv('CHROME_PROFILE_MAX_DISK_MB', '2048'))
+    FIRST_TOKEN_TIMEOUT = float(os.getenv('FIRST_TOKEN_TIMEOUT', '30'))
+    RESPONSE_MAX_WAIT = float(os.getenv('RESPONSE_MAX_WAIT', '180'))
+    RESPONSE_SELECTORS = [s.strip() for s in os.getenv('RESPONSE_SELECTORS', '').split(',') if s.strip()] or None
+    STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+    STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+    RESPONSE_STORE = os.getenv('RESPONSE_STORE', 'sqlite').lower()
+    RESPONSE_DB_PATH = os.getenv('RESPONSE_DB_PATH', 'data/gemtelebot.db')
+    RESPONSE_RETENTION_DAYS = float(os.getenv('RESPONSE_RETENTION_DAYS', '0'))
+    SETTINGS_DB_PATH = os.getenv('SETTINGS_DB_PATH', RESPONSE_DB_PATH)
+    NEWS_CACHE_TTL = float(os.getenv('NEWS_CACHE_TTL', '1800'))
+    NEWS_CACHE_SIZE = int(os.getenv('NEWS_CACHE_SIZE', '256'))
+    NEWS_CACHE_FILE = os.getenv('NEWS_CACHE_FILE') or None
+    MSG_CACHE_TTL = float(os.getenv('MSG_CACHE_TTL', '1800'))
+    MSG_CACHE_SIZE = int(os.getenv('MSG_CACHE_SIZE', '1000'))
+    MSG_CACHE_THRESHOLD = float(os.getenv('MSG_CACHE_THRESHOLD', '0.85'))
+    PREFETCH_INTERVAL = float(os.getenv('PREFETCH_INTERVAL', '0'))
+    PREFETCH_TIMES = [t.strip() for t in os.getenv('PREFETCH_TIMES', '').split(',') if t.strip()]
+    ADMISSION_CAPACITY = int(os.getenv('ADMISSION_CAPACITY', str(SCRAPER_WORKERS)))
+    ADMISSION_MAX_WAITING = int(os.getenv('ADMISSION_MAX_WAITING', str(SCRAPER_MAX_QUEUE)))
+    USER_RATE_BURST = int(os.getenv('USER_RATE_BURST', '3'))
+    USER_RATE_REFILL_SECONDS = float(os.getenv('USER_RATE_REFILL_SECONDS', '20'))
+    BACKEND_POLICY = os.getenv('BACKEND_POLICY', 'api_first')
+    BACKEND_POLICY_NEWS = os.getenv('BACKEND_POLICY_NEWS')
+    BACKEND_POLICY_MSG = os.getenv('BACKEND_POLICY_MSG')
+    GEMINI_API_MODEL = os.getenv('GEMINI_API_MODEL', 'gemini-2.0-flash')
+    GEMINI_API_BASE_URL = os.getenv('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com')
+    GEMINI_API_SEARCH = os.getenv('GEMINI_API_SEARCH', 'true').lower() == 'true'
+    RESPONSE_PAGE_BATCH = int(os.getenv('RESPONSE_PAGE_BATCH', '3'))
+    RESPONSE_PAGE_TTL = float(os.getenv('RESPONSE_PAGE_TTL', '86400'))
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+    SCRAPER_MODE = os.getenv('SCRAPER_MODE', 'local').lower()
+    JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'data/jobs.db')
+    JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '30'))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+    SCRAPE_MAX_ATTEMPTS = int(os.getenv('SCRAPE_MAX_ATTEMPTS', '2'))
+    SCRAPE_RETRY_DELAY = float(os.getenv('SCRAPE_RETRY_DELAY', '1'))
+    CIRCUIT_FAILURE_RATE = float(os.getenv('CIRCUIT_FAILURE_RATE', '0.5'))
+    CIRCUIT_MIN_REQUESTS = int(os.getenv('CIRCUIT_MIN_REQUESTS', '5'))
+    CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '60'))
+    BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+    WEBHOOK_CERT = os.getenv('WEBHOOK_CERT') or None
+    WEBHOOK_KEY = os.getenv('WEBHOOK_KEY') or None
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+    BOT_API_POOL_SIZE = int(os.getenv('BOT_API_POOL_SIZE', '256'))
+    BOT_API_POOL_TIMEOUT = float(os.getenv('BOT_API_POOL_TIMEOUT', '10'))
+    TRACE_LOG_PATH = os.getenv('TRACE_LOG_PATH') or None
     
     if not BOT_TOKEN or not GEMINI_API_KEY:
         logger.error("TELEGRAM_BOT_TOKEN 또는 GEMINI_API_KEY가 설정되지 않았습니다.")
         return
 
+    webhook = None
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL:
+            logger.error("웹훅 모드에서는 WEBHOOK_URL을 설정해야 합니다.")
+            return
+        webhook = {
+            'listen': WEBHOOK_LISTEN,
+            'port': WEBHOOK_PORT,
+            'url_path': WEBHOOK_PATH,
+            'webhook_url': f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            'secret_token': WEBHOOK_SECRET,
+            'cert': WEBHOOK_CERT,
+            'key': WEBHOOK_KEY,
+            'max_connections': WEBHOOK_MAX_CONNECTIONS,
+        }
+
     # Google Sheets 로거 초기화
-    sheet_logger = GoogleSheetLogger(GOOGLE_CREDENTIALS_FILE, GOOGLE_SHEET_NAME)
+    sheet_logger = GoogleSheetLogger(GOOGLE_CREDENTIALS_FILE, GOOGLE_SHEET_NAME, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL)
 
-    bot = TelegramNewsBot(BOT_TOKEN, sheet_logger)
+    executor = ScrapeExecutor(SCRAPER_WORKERS, SCRAPER_MAX_QUEUE, SCRAPER_TIMEOUT)
+    profile_manager = ChromeProfileManager(CHROME_PROFILE_DIR, CHROME_PROFILE_TEMPLATE, CHROME_PROFILE_MAX_DISK_MB)
+    driver_pool = None
+    queue_backend = None
+    if SCRAPER_MODE == 'queue':
+        # Chrome은 워커 프로세스에서만 실행하므로 봇 프로세스에는 드라이버 풀을 만들지 않는다
+        job_queue = SqliteJobQueue(JOB_QUEUE_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS)
+        job_queue.purge()
+        queue_backend = QueueBackend(job_queue, SCRAPER_TIMEOUT)
+    elif DRIVER_POOL_SIZE > 0:
+        driver_pool = DriverPool(profile_manager, DRIVER_POOL_SIZE, DRIVER_MAX_USES, DRIVER_MAX_IDLE, DRIVER_MAX_HEAP_MB)
+    detector = ResponseCompletionDetector(FIRST_TOKEN_TIMEOUT, RESPONSE_MAX_WAIT, response_selectors=RESPONSE_SELECTORS)
+    store = None
+    if RESPONSE_STORE == 'sqlite':
+        store = SqliteResponseStore(RESPONSE_DB_PATH)
+        if RESPONSE_RETENTION_DAYS > 0:
+            store.compact(RESPONSE_RETENTION_DAYS)
+    # 캐시 파일을 따로 지정하지 않으면 응답 저장소를 캐시 백엔드로 사용한다
+    news_cache = ResponseCache(NEWS_CACHE_TTL, NEWS_CACHE_SIZE, NEWS_CACHE_FILE,
+                               None if NEWS_CACHE_FILE else store)
+    api_backend = GeminiApiBackend(GEMINI_API_KEY, GEMINI_API_MODEL, GEMINI_API_BASE_URL,
+                                   use_search=GEMINI_API_SEARCH, store=store)
+    command_policies = {command: policy for command, policy in
+                        (('news', BACKEND_POLICY_NEWS), ('msg', BACKEND_POLICY_MSG)) if policy}
+    bot = TelegramNewsBot(
+        BOT_TOKEN, sheet_logger,
+        executor=executor,
+        driver_pool=driver_pool,
+        warmup=DRIVER_WARMUP,
+        profile_manager=profile_manager,
+        detector=detector,
+        streaming=STREAM_RESPONSES,
+        stream_edit_interval=STREAM_EDIT_INTERVAL,
+        news_cache=news_cache,
+        prefetch_interval=PREFETCH_INTERVAL,
+        prefetch_times=PREFETCH_TIMES,
+        store=store,
+        settings_store=UserSettingsStore(SETTINGS_DB_PATH),
+        api_backend=api_backend,
+        backend_policy=BACKEND_POLICY,
+        command_policies=command_policies,
+        admission=AdmissionController(ADMISSION_CAPACITY, ADMISSION_MAX_WAITING, USER_RATE_BURST, USER_RATE_REFILL_SECONDS),
+        page_store=PagedResponseStore(RESPONSE_PAGE_TTL),
+        page_batch=RESPONSE_PAGE_BATCH,
+        metrics_port=METRICS_PORT,
+        trace_log=TraceLog(TRACE_LOG_PATH) if TRACE_LOG_PATH else None,
+        bot_api_pool_size=BOT_API_POOL_SIZE,
+        bot_api_pool_timeout=BOT_API_POOL_TIMEOUT,
+        queue_backend=queue_backend,
+        msg_index=PromptSimilarityIndex(MSG_CACHE_TTL, MSG_CACHE_SIZE, MSG_CACHE_THRESHOLD),
+        scrape_max_attempts=SCRAPE_MAX_ATTEMPTS,
+        scrape_retry_delay=SCRAPE_RETRY_DELAY,
+        breaker_options={'failure_rate': CIRCUIT_FAILURE_RATE, 'min_requests': CIRCUIT_MIN_REQUESTS,
+                         'open_seconds': CIRCUIT_OPEN_SECONDS},
+    )
     try:
-        bot.run_bot()
+        bot.run_bot(webhook)
     except KeyboardInterrupt:
         logger.info("봇을 종료합니다...")
     except Exception as e:
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+기존 응답 JSON 파일을 SQLite 응답 저장소로 옮기는 스크립트
+- gemini_news_*.json / gemini_response_*.json 파일을 찾아 가져옴
+- --delete 옵션을 주면 가져온 파일을 삭제
+"""
+
+import argparse
+import os
+from gemini_telegrambot import SqliteResponseStore
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="응답 JSON 파일을 SQLite 저장소로 가져옵니다.")
+    parser.add_argument("directory", nargs="?", default=".", help="JSON 파일이 있는 디렉토리 (기본값: 현재 디렉토리)")
+    parser.add_argument("--db", default=os.getenv('RESPONSE_DB_PATH', 'data/gemtelebot.db'), help="SQLite 파일 경로")
+    parser.add_argument("--delete", action="store_true", help="가져온 JSON 파일 삭제")
+    args = parser.parse_args()
+
+    store = SqliteResponseStore(args.db)
+    store.import_json_files(args.directory, delete=args.delete)
+    store.close()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Gemini 스크래퍼 워커
+- 봇(SCRAPER_MODE=queue)이 작업 대기열에 넣은 스크래핑 작업을 가져와 Chrome으로 실행
+- 결과를 작업 대기열에 기록하면 봇이 요청한 대화로 전송
+- 같은 JOB_QUEUE_PATH를 사용하는 워커 프로세스를 여러 개 실행하여 처리량을 늘릴 수 있음
+"""
+
+import argparse
+import os
+import signal
+import threading
+import time
+from gemini_telegrambot import (
+    ChromeProfileManager, DriverPool, GeminiNewsScraper, MetricsServer, ResponseCompletionDetector,
+    ResponseExtractor, SelectorResolver, SqliteJobQueue, SqliteResponseStore, chrome_rss_bytes, logger, metrics,
+)
+
+
+class ScraperWorker:
+    """작업 대기열에서 작업을 하나씩 가져와 스크래퍼로 실행하는 워커 (스레드 하나에 워커 하나)"""
+    def __init__(self, job_queue, scraper_factory, worker_id, poll_interval=1.0, progress_interval=1.0):
+        self.job_queue = job_queue
+        self.scraper_factory = scraper_factory
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = job_queue.lease_seconds / 3
+
+    def run(self, stop_event):
+        """종료 요청이 올 때까지 작업 처리 (실행 중인 작업은 끝까지 처리)"""
+        last_heartbeat = 0
+        while not stop_event.is_set():
+            try:
+                job = self.job_queue.claim(self.worker_id)
+                if job is None:
+                    if time.time() - last_heartbeat >= self.heartbeat_interval:
+                        self.job_queue.heartbeat(self.worker_id)
+                        last_heartbeat = time.time()
+                    stop_event.wait(self.poll_interval)
+                    continue
+                self.process(job)
+            except Exception as e:
+                logger.error(f"워커 {self.worker_id} 오류: {e}")
+                stop_event.wait(self.poll_interval)
+
+    def keep_alive(self, job, scraper, progress, done):
+        """실행 중인 작업의 임대를 연장하고 중간 응답을 기록 (임대를 잃거나 기한이 지나면 스크래핑 취소)"""
+        sent = None
+        last_heartbeat = time.time()
+        while not done.wait(self.progress_interval):
+            text = progress.get('text')
+            if text == sent and time.time() - last_heartbeat < self.heartbeat_interval:
+                continue
+            try:
+                owned = self.job_queue.heartbeat(self.worker_id, job['id'], text if text != sent else None)
+            except Exception as e:
+                logger.warning(f"하트비트 실패 ({job['id']}): {e}")
+                continue
+            sent, last_heartbeat = text, time.time()
+            if not owned or time.time() > job['deadline']:
+                logger.warning(f"작업 {job['id']}의 임대를 잃었거나 기한이 지나 스크래핑을 중단합니다.")
+                progress['lost'] = True
+                scraper.cancel()
+                return
+
+    def process(self, job):
+        payload = job['payload']
+        logger.info(f"작업 시작: {job['id']} (시도 {job['attempts']}/{job['max_attempts']})")
+        scraper = self.scraper_factory(payload.get('user_id'))
+        progress = {}
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self.keep_alive, args=(job, scraper, progress, done), daemon=True)
+        heartbeat.start()
+        try:
+            ref, data = scraper.run(payload['prompt'], payload['lang'], payload['region'],
+                                    lambda text: progress.__setitem__('text', text))
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if progress.get('lost'):
+            return
+        if data:
+            self.job_queue.complete(job['id'], self.worker_id, {'ref': ref, 'data': data})
+            logger.info(f"작업 완료: {job['id']}")
+        else:
+            # 재시도해도 소용없는 실패는 바로 실패 처리하여 다른 워커가 다시 가져가지 않도록 한다
+            failure = scraper.failure
+            retry = failure is None or failure.retryable
+            kind = failure.kind if failure else "unknown"
+            self.job_queue.fail(job['id'], self.worker_id, f"응답을 받지 못했습니다. ({kind})", retry=retry)
+            logger.warning(f"작업 실패: {job['id']} ({kind})")
+
+
+def build_scraper_factory(concurrency):
+    """봇과 같은 환경 변수로 드라이버 풀, 완료 감지기, 저장소를 구성한 스크래퍼 생성 함수"""
+    profile_manager = ChromeProfileManager(
+        os.getenv('CHROME_PROFILE_DIR', '/tmp/gemtelebot_profiles'),
+        os.getenv('CHROME_PROFILE_TEMPLATE', '/tmp/chrome_profile'),
+        int(os.getenv('CHROME_PROFILE_MAX_DISK_MB', '2048')),
+    )
+    driver_pool = None
+    if int(os.getenv('DRIVER_POOL_SIZE', str(concurrency))) > 0:
+        driver_pool = DriverPool(
+            profile_manager, concurrency,
+            int(os.getenv('DRIVER_MAX_USES', '20')),
+            float(os.getenv('DRIVER_MAX_IDLE', '600')),
+            int(os.getenv('DRIVER_MAX_HEAP_MB', '512')),
+        )
+    selectors = [s.strip() for s in os.getenv('RESPONSE_SELECTORS', '').split(',') if s.strip()] or None
+    detector = ResponseCompletionDetector(
+        float(os.getenv('FIRST_TOKEN_TIMEOUT', '30')), float(os.getenv('RESPONSE_MAX_WAIT', '180')),
+        response_selectors=selectors,
+    )
+    store = None
+    if os.getenv('RESPONSE_STORE', 'sqlite').lower() == 'sqlite':
+        store = SqliteResponseStore(os.getenv('RESPONSE_DB_PATH', 'data/gemtelebot.db'))
+    extractor = ResponseExtractor(detector.response_selectors)
+    resolver = SelectorResolver()
+
+    def factory(user_id=None):
+        return GeminiNewsScraper(driver_pool, profile_manager, detector, store, user_id, extractor, resolver)
+
+    return factory, driver_pool, store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="작업 대기열의 Gemini 스크래핑 작업을 처리합니다.")
+    parser.add_argument("--queue", default=os.getenv('JOB_QUEUE_PATH', 'data/jobs.db'), help="작업 대기열 SQLite 파일 경로")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv('SCRAPER_WORKERS', '2')),
+                        help="이 프로세스에서 동시에 실행할 스크래퍼 수 (Chrome 세션 수)")
+    parser.add_argument("--worker-id", default=None, help="워커 이름 (기본값: 호스트명-PID)")
+    parser.add_argument("--no-warmup", action="store_true", help="시작 시 Chrome 세션을 미리 실행하지 않음")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv('METRICS_PORT', '0')),
+                        help="지표(/metrics)를 제공할 HTTP 포트 (0이면 사용 안 함, 워커마다 다른 포트 사용)")
+    args = parser.parse_args()
+
+    job_queue = SqliteJobQueue(args.queue, float(os.getenv('JOB_LEASE_SECONDS', '30')),
+                               int(os.getenv('JOB_MAX_ATTEMPTS', '2')))
+    factory, driver_pool, store = build_scraper_factory(args.concurrency)
+    metrics_server = None
+    if args.metrics_port:
+        # 스크래핑 단계별 시간과 Chrome 자원 사용량은 Chrome을 실행하는 워커에서만 측정된다
+        if driver_pool:
+            driver_pool.register_gauges()
+        metrics.gauge("gemtelebot_chrome_rss_bytes", "chromedriver/Chrome 프로세스 RSS 합계(바이트)", chrome_rss_bytes)
+        metrics_server = MetricsServer(metrics, args.metrics_port).start()
+    if driver_pool and not args.no_warmup:
+        driver_pool.warmup()
+
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop_event.set())
+
+    base_id = args.worker_id or f"{os.uname().nodename}-{os.getpid()}"
+    threads = []
+    for i in range(args.concurrency):
+        worker = ScraperWorker(job_queue, factory, f"{base_id}-{i}" if args.concurrency > 1 else base_id)
+        thread = threading.Thread(target=worker.run, args=(stop_event,), name=f"worker-{i}")
+        thread.start()
+        threads.append(thread)
+    logger.info(f"스크래퍼 워커 {args.concurrency}개를 시작했습니다. (대기열: {args.queue}, ID: {base_id})")
+
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=0.5)
+    logger.info("실행 중인 작업을 마치고 워커를 종료합니다.")
+    if metrics_server:
+        metrics_server.close()
+    if driver_pool:
+        driver_pool.close()
+    if store:
+        store.close()
+    job_queue.close()
@@ -0,0 +1,35 @@
+import pytest
+
+from gemini_telegrambot import PromptSimilarityIndex
+
+
+def make_index(*prompts):
+    index = PromptSimilarityIndex()
+    for prompt in prompts:
+        index.add(prompt, 'ko', 'KR', {'prompt': prompt})
+    return index
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("미국 경제 전망에 대해 자세히 설명해줘", "미국 경제 전망에 대해 좀 자세히 설명해줘"),
+    ("파이썬으로 웹 크롤링하는 방법 알려줘", "파이썬으로 웹크롤링하는 방법 알려줘"),
+    ("삼성전자 주가 전망 알려줘", "삼성 전자 주가 전망 알려줘 좀"),
+])
+def test_near_duplicates_hit(cached, asked):
+    match = make_index(cached).lookup(asked, 'ko', 'KR')
+    assert match is not None
+    assert match[0]['prompt'] == cached
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("미국 경제 전망에 대해 자세히 설명해줘", "중국 경제 전망에 대해 자세히 설명해줘"),
+    ("삼성전자 주가 전망 알려줘", "LG전자 주가 전망 알려줘"),
+    ("삼성전자 2023년 실적 알려줘", "삼성전자 2024년 실적 알려줘"),
+])
+def test_entity_swaps_miss(cached, asked):
+    assert make_index(cached).lookup(asked, 'ko', 'KR') is None
+
+
+def test_other_region_misses():
+    index = make_index("미국 경제 전망에 대해 자세히 설명해줘")
+    assert index.lookup("미국 경제 전망에 대해 자세히 설명해줘", 'en', 'US') is None